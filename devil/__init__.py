@@ -11,6 +11,9 @@ import sys
 import datamapper
 from devil.mappers.xmlmapper import XmlMapper
 from devil.mappers.jsonmapper import JsonMapper
+from devil.mappers.msgpackmapper import MsgPackMapper
+from devil.mappers.ndjsonmapper import NdjsonMapper
+from devil.mappers.csvmapper import CsvMapper
 
 
 from devil.resource import Resource
@@ -48,12 +51,22 @@ def register_mappers():
     datamapper.manager.register_mapper(jsonmapper, 'text/x-javascript', 'json')
     datamapper.manager.register_mapper(jsonmapper, 'text/x-json', 'json')
 
+    # csv mapper
+    datamapper.manager.register_mapper(CsvMapper(), 'text/csv', 'csv')
+
     # text mapper
     datamapper.manager.register_mapper(textmapper, 'text/plain', 'text')
 
     # xml mapper
     datamapper.manager.register_mapper(xmlmapper, 'text/xml', 'xml')
 
+    # ndjson mapper
+    datamapper.manager.register_mapper(NdjsonMapper(), 'application/x-ndjson', 'ndjson')
+
+    # msgpack mapper (only if msgpack is installed)
+    if MsgPackMapper.available:
+        datamapper.manager.register_mapper(MsgPackMapper(), 'application/x-msgpack', 'msgpack')
+
     # json mapper
     datamapper.manager.register_mapper(jsonmapper, 'application/json', 'json')
 
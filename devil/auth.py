@@ -7,11 +7,64 @@
 
 
 import base64
+import hashlib
+import hmac
+import tempfile
+import time
+import uuid
+from copy import copy
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.contrib.auth.models import AnonymousUser
+from django.db.models.signals import post_save, post_delete
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
 from errors import Unauthorized, Forbidden
 
 
+def get_user_model():
+    """ Return the user model (``User`` in Django < 1.5). """
+    try:
+        from django.contrib.auth import get_user_model
+    except ImportError:
+        from django.contrib.auth.models import User
+        return User
+    return get_user_model()
+
+
 class HttpBasic(object):
+    """ HTTP Basic authentication.
+
+    Checking the password is expensive by design (the hash is computed
+    with many iterations) and needs a database query. Clients using Basic
+    authentication send the credentials with every request, so the
+    results may be cached: successful authentications until the user
+    object is saved (e.g. the password is changed) or deleted, or until
+    the cache expires them, and failed ones for ``negative_timeout``
+    seconds or until any user is saved or deleted. The cache is keyed on
+    a keyed hash (HMAC) of the credentials, they are never stored as
+    such.
+
+    The invalidation relies on Django's signals, so it only reaches
+    other processes if they share the cache (e.g. ``DjangoCache``).
+    """
+
+    def __init__(self, cache=None, negative_timeout=60):
+        """ Initialize the authenticator.
+
+        :param cache: cache for the authentication results, e.g.
+                      ``devil.cache.LocalCache``. ``None`` disables caching.
+        :param negative_timeout: how long (in seconds) failed
+                                 authentications are cached.
+        """
+
+        self.cache = cache
+        self.negative_timeout = negative_timeout
+        if cache is not None:
+            user_model = get_user_model()
+            post_save.connect(self._user_changed, sender=user_model)
+            post_delete.connect(self._user_changed, sender=user_model)
+
     def authenticate(self, request):
         """ Authenticate request using HTTP Basic authentication protocl.
 
@@ -33,8 +86,7 @@ class HttpBasic(object):
             auth = request.META['HTTP_AUTHORIZATION'].split()
             if len(auth) == 2:
                 if auth[0].lower() == "basic":
-                    uname, passwd = base64.b64decode(auth[1]).split(':')
-                    user = authenticate(username=uname, password=passwd)
+                    user = self._get_user(auth[1])
                     if user is not None:
                         if user.is_active:
                             request.user = user
@@ -46,6 +98,260 @@ class HttpBasic(object):
         # we'll return a challenge for the user anyway
         raise Unauthorized()
 
+    def invalidate(self, user):
+        """ Forget cached authentications of the user.
+
+        All cached failures are forgotten too since they may have been
+        attempts with the user's new credentials.
+        """
+
+        if self.cache is not None:
+            self.cache.set(self._get_generation_key(user.pk), uuid.uuid4().hex)
+            self.cache.set(self._get_generation_key(None), uuid.uuid4().hex)
+
+    def _get_user(self, credentials):
+        """ Return the user matching the credentials (or ``None``).
+
+        :param credentials: base64 encoded ``username:password``
+        """
+
+        if self.cache is None:
+            return self._check_credentials(credentials)
+
+        key = self._get_cache_key(credentials)
+        failure_generation = self._get_generation(None)
+        entry = self.cache.get(key)
+        if entry is not None:
+            user, generation = entry
+            if user is None:
+                if generation == failure_generation:
+                    # failed recently
+                    return None
+            elif generation == self._get_generation(user.pk):
+                return copy(user)
+
+        user = self._check_credentials(credentials)
+        if user is None:
+            self.cache.set(key, (None, failure_generation), self.negative_timeout)
+        else:
+            self.cache.set(key, (copy(user), self._get_generation(user.pk)))
+        return user
+
+    def _check_credentials(self, credentials):
+        """ Authenticate the credentials using Django's authentication. """
+        uname, passwd = base64.b64decode(credentials).split(':')
+        return authenticate(username=uname, password=passwd)
+
+    def _get_cache_key(self, credentials):
+        digest = hmac.new(settings.SECRET_KEY, credentials, hashlib.sha256)
+        return ('devil-auth', digest.hexdigest())
+
+    def _get_generation(self, pk):
+        """ Return the generation of the user's cached authentications.
+
+        Invalidating starts a new generation, which makes the older
+        entries of the user unusable. The ``pk`` ``None`` stands for the
+        cached failures.
+        """
+
+        key = self._get_generation_key(pk)
+        generation = self.cache.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.cache.set(key, generation)
+        return generation
+
+    def _get_generation_key(self, pk):
+        return ('devil-auth-user', pk)
+
+    def _user_changed(self, sender, instance, **kw):
+        """ Signal handler for saved and deleted users. """
+        self.invalidate(instance)
+
+
+class HttpHmac(object):
+    """ Stateless authentication with HMAC signed tokens or requests.
+
+    Both schemes are verified against a set of secret keys (``key id ->
+    secret``) without touching the database. Two ``Authorization``
+    header schemes are supported:
+
+      * ``Bearer <key id>.<user id>.<expires>.<signature>`` where
+        ``expires`` is a unix timestamp and ``signature`` is HMAC-SHA256
+        of ``<key id>.<user id>.<expires>``. Create tokens with
+        ``make_token()``.
+      * ``HMAC <key id>:<user id>:<timestamp>:<signature>`` where
+        ``signature`` is HMAC-SHA256 over the request: the method, the
+        full path, the user id, the timestamp and SHA-256 of the body,
+        joined with newlines. The timestamp must be within ``max_age``
+        seconds of the server's time. Create the header with ``sign()``.
+
+    The user object is loaded only when ``request.user`` is used. If the
+    user doesn't exist (anymore) or is not active, ``request.user`` turns
+    out to be anonymous. Resources that don't allow anonymous access
+    load the user right away and reject such requests.
+    """
+
+    #: size of the chunks in which the request body is hashed
+    chunk_size = 64 * 1024
+    #: bodies larger than this are spooled to disk while hashing
+    spool_size = 1024 * 1024
+
+    def __init__(self, keys=None, max_age=300):
+        """ Initialize the authenticator.
+
+        :param keys: dictionary of key ids and secrets. If ``None``,
+                     ``DEVIL_HMAC_KEYS`` from Django settings is used.
+        :param max_age: maximum age (in seconds) of signed requests.
+        """
+
+        self._keys = keys
+        self.max_age = max_age
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            return getattr(settings, 'DEVIL_HMAC_KEYS', {})
+        return self._keys
+
+    def authenticate(self, request):
+        """ Authenticate the request using a token or a request signature.
+
+        Raises Unauthorized if the request doesn't carry a token or a
+        signature and Forbidden if it is not valid.
+        """
+
+        if request.user and request.user.is_authenticated():
+            return request.user
+
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth) == 2:
+            scheme = auth[0].lower()
+            if scheme == 'bearer':
+                user_id = self._verify_token(auth[1])
+            elif scheme == 'hmac':
+                user_id = self._verify_signature(request, auth[1])
+            else:
+                raise Unauthorized()
+            if user_id is None:
+                raise Forbidden()
+            request.user = SimpleLazyObject(lambda: self._load_user(user_id))
+            return request.user
+
+        raise Unauthorized()
+
+    def make_token(self, user, key_id, expires_in=3600):
+        """ Create bearer token for the user.
+
+        :param key_id: id of the key that signs the token
+        :param expires_in: lifetime of the token in seconds
+        """
+
+        payload = '%s.%s.%d' % (key_id, user.pk, int(time.time() + expires_in))
+        return '%s.%s' % (payload, self._sign(key_id, payload))
+
+    def sign(self, method, path, body, user, key_id, timestamp=None):
+        """ Return ``Authorization`` header value for a signed request.
+
+        :param path: full path of the request (with the query string)
+        :param body: the request body (a string)
+        """
+
+        timestamp = str(int(time.time() if timestamp is None else timestamp))
+        message = self._get_request_message(
+            method, path, str(user.pk), timestamp, hashlib.sha256(body).hexdigest())
+        return 'HMAC %s:%s:%s:%s' % (key_id, user.pk, timestamp, self._sign(key_id, message))
+
+    def _verify_token(self, token):
+        """ Return the user id of a valid token (or ``None``). """
+
+        parts = token.split('.')
+        if len(parts) != 4:
+            return None
+        key_id, user_id, expires, signature = parts
+        if not self._check_signature(key_id, '.'.join(parts[:3]), signature):
+            return None
+        try:
+            if int(expires) < time.time():
+                return None
+        except ValueError:
+            return None
+        return user_id
+
+    def _verify_signature(self, request, credentials):
+        """ Return the user id of a validly signed request (or ``None``). """
+
+        parts = credentials.split(':')
+        if len(parts) != 4:
+            return None
+        key_id, user_id, timestamp, signature = parts
+        # cheap checks first, the body may be large
+        if key_id not in self.keys:
+            return None
+        try:
+            if abs(time.time() - int(timestamp)) > self.max_age:
+                return None
+        except ValueError:
+            return None
+        message = self._get_request_message(
+            request.method, request.get_full_path(), user_id, timestamp,
+            self._hash_body(request))
+        if not self._check_signature(key_id, message, signature):
+            return None
+        return user_id
+
+    def _hash_body(self, request):
+        """ Return SHA-256 hex digest of the request body.
+
+        Unless the body is already in memory, it is read in chunks and
+        spooled into a temporary file that then replaces the request's
+        stream, so the resource can still read the body.
+        """
+
+        digest = hashlib.sha256()
+        if not request.META.get('CONTENT_LENGTH'):
+            pass
+        elif hasattr(request, '_body') or not hasattr(request, '_stream'):
+            digest.update(request.body)
+        else:
+            spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            while True:
+                chunk = request.read(self.chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                spool.write(chunk)
+            spool.seek(0)
+            # django's HttpRequest reads the body from _stream
+            request._stream = spool
+            request._read_started = False
+        return digest.hexdigest()
+
+    def _get_request_message(self, method, path, user_id, timestamp, body_hash):
+        """ Return the string that is signed for a request. """
+        return '\n'.join((method.upper(), path, user_id, timestamp, body_hash))
+
+    def _check_signature(self, key_id, message, signature):
+        """ Compare the signature in constant time. """
+        if key_id not in self.keys:
+            return False
+        return constant_time_compare(self._sign(key_id, message), signature)
+
+    def _sign(self, key_id, message):
+        secret = self.keys[key_id]
+        return hmac.new(str(secret), message, hashlib.sha256).hexdigest()
+
+    def _load_user(self, user_id):
+        """ Return the active user or ``AnonymousUser``. """
+
+        user_model = get_user_model()
+        try:
+            user = user_model._default_manager.get(pk=user_id)
+        except (user_model.DoesNotExist, ValueError):
+            return AnonymousUser()
+        if not user.is_active:
+            return AnonymousUser()
+        return user
 
 #
 # auth.py ends here
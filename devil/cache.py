@@ -0,0 +1,133 @@
+#  -*- coding: utf-8 -*-
+# cache.py ---
+#
+# Created: Sun Oct 18 2026
+#
+
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache(object):
+    """ In-process cache with LRU eviction and expiration.
+
+    Thread safe. The interface is a subset of Django's cache API
+    (``get()``, ``set()``, ``delete()``) so that ``DjangoCache`` can be
+    used in place of this.
+    """
+
+    def __init__(self, max_size=1024, timeout=300):
+        """ Initialize the cache.
+
+        :param max_size: maximum number of entries. The least recently
+                         used entries are evicted first.
+        :param timeout: default lifetime of the entries in seconds
+                        (``None`` means that the entries don't expire).
+        """
+
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ Return the value or ``default`` if it's not found or expired. """
+
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.time():
+                return default
+            # most recently used go last
+            self._entries[key] = (expires, value)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """ Store the value.
+
+        :param timeout: lifetime of the entry in seconds. If ``None``,
+                        ``self.timeout`` is used.
+        """
+
+        if timeout is None:
+            timeout = self.timeout
+        expires = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """ Remove the entry (if present). """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """ Remove all entries. """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCache(object):
+    """ Adapter for a cache configured in Django's cache framework.
+
+    Keys may be any values with a stable ``repr()`` (e.g. tuples of
+    strings and numbers). They are hashed into keys that are valid
+    for all Django cache backends. Values must be picklable.
+    """
+
+    def __init__(self, alias='default', timeout=None, prefix='devil'):
+        """ Initialize the adapter.
+
+        :param alias: name of the cache in Django's ``CACHES`` setting
+        :param timeout: default lifetime of the entries in seconds. If
+                        ``None``, the cache's own default is used.
+        :param prefix: prefix for the keys
+        """
+
+        self.alias = alias
+        self.timeout = timeout
+        self.prefix = prefix
+        self._cache = None
+
+    def get(self, key, default=None):
+        return self._get_cache().get(self._make_key(key), default)
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if timeout is None:
+            self._get_cache().set(self._make_key(key), value)
+        else:
+            self._get_cache().set(self._make_key(key), value, timeout)
+
+    def delete(self, key):
+        self._get_cache().delete(self._make_key(key))
+
+    def _get_cache(self):
+        """ Return the Django cache (looked up on first use). """
+        if self._cache is None:
+            try:
+                from django.core.cache import caches
+            except ImportError:
+                # django < 1.7
+                from django.core.cache import get_cache
+                self._cache = get_cache(self.alias)
+            else:
+                self._cache = caches[self.alias]
+        return self._cache
+
+    def _make_key(self, key):
+        return '%s:%s' % (self.prefix, hashlib.md5(repr(key)).hexdigest())
+
+#
+# cache.py ends here
@@ -0,0 +1,161 @@
+#  -*- coding: utf-8 -*-
+# compression.py ---
+#
+# Created: Sun Oct 18 2026
+#
+
+
+import zlib
+from devil import errors
+
+
+#: supported content codings in the order of preference
+encodings = ('gzip', 'deflate')
+
+#: zlib window bits for each content coding (gzip adds the gzip wrapper)
+_wbits = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+    }
+
+# names some clients still use
+_aliases = {
+    'x-gzip': 'gzip',
+    }
+
+
+def normalize_encoding(encoding):
+    """ Return the canonical name of the content coding (or ``None``).
+
+    :param encoding: value of the ``Content-Encoding`` header
+    :returns: ``None`` if the content is not encoded
+    """
+
+    encoding = encoding.strip().lower()
+    if not encoding or encoding == 'identity':
+        return None
+    return _aliases.get(encoding, encoding)
+
+
+def select_encoding(accept_encoding):
+    """ Select the content coding for the response.
+
+    :param accept_encoding: value of the ``Accept-Encoding`` header
+    :returns: the most preferred supported coding that the client
+              accepts or ``None`` if the response shouldn't be compressed.
+    """
+
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[normalize_encoding(coding)] = quality
+
+    best, best_quality = None, 0.0
+    for coding in encodings:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def get_compressor(encoding, level=6):
+    """ Return zlib compression object for the content coding. """
+    return zlib.compressobj(level, zlib.DEFLATED, _wbits[encoding])
+
+
+def compress(data, encoding, level=6):
+    """ Compress the data (string) with the content coding. """
+    compressor = get_compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding, level=6):
+    """ Compress an iterable of strings incrementally.
+
+    :returns: iterator of compressed chunks
+    """
+
+    compressor = get_compressor(encoding, level)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class DecompressingStream(object):
+    """ File-like object that decompresses the data of another stream.
+
+    The data is decompressed as it is read and at most ``chunk_size``
+    bytes are decompressed at a time, so that a small body that expands
+    to a huge one (a "zip bomb") is caught before it is in memory.
+    """
+
+    def __init__(self, stream, encoding, max_size=None, chunk_size=64 * 1024):
+        """ Initialize the stream.
+
+        :param stream: file-like object providing the compressed data
+        :param encoding: content coding of the data ('gzip' or 'deflate')
+        :param max_size: maximum size of the decompressed data in bytes
+        :param chunk_size: size of the chunks read and decompressed
+        """
+
+        self._stream = stream
+        self._decompressor = zlib.decompressobj(_wbits[encoding])
+        self._buffer = ''
+        self._eof = False
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        #: number of decompressed bytes so far
+        self.size = 0
+
+    def read(self, size=-1):
+        """ Read and return at most ``size`` decompressed bytes.
+
+        :raises: BadRequest if the data is not valid,
+                 RequestEntityTooLarge if ``max_size`` is exceeded.
+        """
+
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        pass
+
+    def _fill(self):
+        """ Decompress the next piece of data into the buffer. """
+
+        decompressor = self._decompressor
+        try:
+            data = decompressor.unconsumed_tail or self._stream.read(self.chunk_size)
+            if data:
+                data = decompressor.decompress(data, self.chunk_size)
+            else:
+                data = decompressor.flush()
+                self._eof = True
+        except zlib.error, exc:
+            raise errors.BadRequest('unable to decompress data: %s' % (str(exc),))
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise errors.RequestEntityTooLarge(
+                'maximum size of decompressed data is %d bytes' % (self.max_size,))
+        self._buffer += data
+
+#
+# compression.py ends here
@@ -7,8 +7,15 @@
 
 
 import re
+import threading
+from collections import OrderedDict
 from django.utils.encoding import smart_unicode, smart_str
 from django.http import HttpResponse
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # django < 1.5: plain HttpResponse accepts an iterator as its content
+    StreamingHttpResponse = HttpResponse
 import errors
 from http import Response
 import util
@@ -23,6 +30,14 @@ class DataMapper(object):
     content_type = 'text/plain'
     charset = 'utf-8'
 
+    #: Can ``parse()`` read the data from a file-like object? If not, the
+    #: data is read into a string before it is given to the mapper.
+    parses_stream = False
+
+    #: Query parameters that ``for_request()`` reads (they affect the
+    #: output, so e.g. response caching needs to know about them).
+    request_params = ()
+
     def format(self, response):
         """ Format the data.
 
@@ -41,12 +56,42 @@ class DataMapper(object):
         res.content = self._format_data(res.content, self.charset)
         return self._finalize_response(res)
 
+    def format_stream(self, response):
+        """ Format an iterable of items incrementally.
+
+        The items are not formatted until the returned response is
+        consumed. In derived classes, override ``_format_data_stream()``
+        instead of this method.
+
+        :param response: devil's ``Response`` object (or the data itself)
+                         whose content is an iterable.
+        :return: django's ``StreamingHttpResponse``
+        """
+
+        res = self._prepare_response(response)
+        chunks = self._format_data_stream(res.content, self.charset)
+        return self._finalize_streaming_response(res, chunks)
+
+    def for_request(self, request, resource=None):
+        """ Return the mapper to be used for formatting the request.
+
+        This is the mapper itself. Mappers whose output may be adjusted per
+        request (or per resource) can override this to return a differently
+        configured mapper.
+
+        :param resource: the resource whose response is being formatted
+        """
+
+        return self
+
     def parse(self, data, charset=None):
         """ Parse the data.
 
         It is usually a better idea to override ``_parse_data()`` than
         this method in derived classes.
 
+        :param data: the data as a string or, if ``self.parses_stream`` is
+        set, possibly as a file-like object.
         :param charset: the charset of the data. Uses datamapper's
         default (``self.charset``) if not given.
         :returns:
@@ -78,6 +123,19 @@ class DataMapper(object):
 
         return self._encode_data(data) if data else u''
 
+    def _format_data_stream(self, items, charset):
+        """ Format the items into chunks of output.
+
+        This default implementation can't format incrementally so it
+        collects all the items and formats them in one go. Override in
+        mappers that can do better.
+
+        :param items: iterable of (serialized) items
+        :returns: iterator of encoded chunks
+        """
+
+        yield self._encode_data(self._format_data(list(items), charset))
+
     def _parse_data(self, data, charset):
         """ Parse the data
 
@@ -111,6 +169,18 @@ class DataMapper(object):
         res.status_code = response.code
         return res
 
+    def _finalize_streaming_response(self, response, chunks):
+        """ Convert the ``Response`` object into django's streaming response
+
+        :param chunks: iterator producing the formatted content
+        :return: django's ``StreamingHttpResponse``
+        """
+
+        res = StreamingHttpResponse(chunks,
+                                    content_type=self._get_content_type())
+        res.status_code = response.code
+        return res
+
     def _get_content_type(self):
         """ Return Content-Type header with charset info. """
         return '%s; charset=%s' % (self.content_type, self.charset)
@@ -130,9 +200,12 @@ class DataMapperManager(object):
     4. HTTP Accept header (for formatting only)
     """
 
-    _format_query_pattern = re.compile('.*\.(?P<format>\w{1,8})$')
+    _format_extension_pattern = re.compile('\w{1,8}$')
     _datamappers = {}
 
+    #: maximum number of distinct Accept headers to remember
+    accept_cache_size = 256
+
     def __init__(self):
         """ Initialize the manager.
 
@@ -143,6 +216,11 @@ class DataMapperManager(object):
         self._datamappers = {
             '*/*': DataMapper()
             }
+        # LRU cache: Accept header -> selected mapper
+        self._accept_cache = OrderedDict()
+        self._accept_cache_lock = threading.Lock()
+        self.accept_cache_hits = 0
+        self.accept_cache_misses = 0
 
     def register_mapper(self, mapper, content_type, shortname=None):
         """ Register new mapper.
@@ -154,6 +232,8 @@ class DataMapperManager(object):
         self._check_mapper(mapper)
         cont_type_names = self._get_content_type_names(content_type, shortname)
         self._datamappers.update(dict([(name, mapper) for name in cont_type_names]))
+        with self._accept_cache_lock:
+            self._accept_cache.clear()
 
     def select_formatter(self, request, resource):
         """ Select appropriate formatter based on the request.
@@ -170,9 +250,9 @@ class DataMapperManager(object):
         if mapper_name:
             return self._get_mapper(mapper_name)
         # 3. get from accept header
-        mapper_name = self._get_name_from_accept(request)
-        if mapper_name:
-            return self._get_mapper(mapper_name)
+        mapper = self._get_mapper_from_accept(request)
+        if mapper:
+            return mapper
         # 4. use resource's default
         if resource.default_mapper:
             return resource.default_mapper
@@ -220,6 +300,8 @@ class DataMapperManager(object):
 
         mapper = mapper or DataMapper()
         self._datamappers['*/*'] = mapper
+        with self._accept_cache_lock:
+            self._accept_cache.clear()
 
     def _get_default_mapper(self):
         """ Return the default mapper.
@@ -252,6 +334,43 @@ class DataMapperManager(object):
             return util.strip_charset(content_type)
         return None
 
+    def _get_mapper_from_accept(self, request):
+        """ Return the mapper selected by the Accept HTTP header.
+
+        The selection is cached per distinct Accept header. The cache is
+        emptied whenever mappers are registered.
+
+        :returns: the mapper or ``None`` if there's no Accept header.
+        :raises: NotAcceptable if we don't support any of the accepted types.
+        """
+
+        accept = request.META.get('HTTP_ACCEPT', '')
+        cache = self._accept_cache
+        with self._accept_cache_lock:
+            mapper = cache.pop(accept, _missing)
+            if mapper is not _missing:
+                self.accept_cache_hits += 1
+                # reinsert as the most recently used item
+                cache[accept] = mapper
+
+        if mapper is _missing:
+            try:
+                mapper_name = self._get_name_from_accept(request)
+            except errors.NotAcceptable:
+                mapper = _not_acceptable
+            else:
+                mapper = self._get_mapper(mapper_name) if mapper_name else None
+            with self._accept_cache_lock:
+                self.accept_cache_misses += 1
+                cache.pop(accept, None)
+                while cache and len(cache) >= self.accept_cache_size:
+                    cache.popitem(last=False)
+                cache[accept] = mapper
+
+        if mapper is _not_acceptable:
+            raise errors.NotAcceptable()
+        return mapper
+
     def _get_name_from_accept(self, request):
         """ Process the Accept HTTP header.
 
@@ -278,13 +397,25 @@ class DataMapperManager(object):
         :returns: short name of the mapper or ``None`` if not found.
         """
 
-        format = request.GET.get('format', None)
+        format = None
+        if request.META.get('QUERY_STRING', True):
+            # don't make django parse an empty query string
+            format = request.GET.get('format', None)
         if not format:
-            match = self._format_query_pattern.match(request.path)
-            if match and match.group('format'):
-                format = match.group('format')
+            format = self._get_format_from_path(request.path)
         return format
 
+    def _get_format_from_path(self, path):
+        """ Return the extension of the path (e.g. ``json`` for /user.json)
+
+        :returns: the extension or ``None`` if the path has no extension.
+        """
+
+        head, dot, extension = path.rpartition('.')
+        if dot and self._format_extension_pattern.match(extension):
+            return extension
+        return None
+
     def _unknown_format(self, format):
         """ Deal with the situation when we don't support the requested format.
 
@@ -310,19 +441,39 @@ class DataMapperManager(object):
             raise ValueError('mapper must implement format()')
 
 
+# marker for cached Accept headers that we don't support
+_not_acceptable = object()
+_missing = object()
+
+
 # singleton instance
 manager = DataMapperManager()
 
 
+def _get_formatter(request, resource):
+    formatter = manager.select_formatter(request, resource)
+    for_request = getattr(formatter, 'for_request', None)
+    return for_request(request, resource) if for_request else formatter
+
+
 # utility function to format outgoing data (selects formatter automatically)
 def format(request, response, resource):
-    return manager.select_formatter(request, resource).format(response)
+    return _get_formatter(request, resource).format(response)
+
+
+# utility function to format outgoing data incrementally
+def format_stream(request, response, resource):
+    return _get_formatter(request, resource).format_stream(response)
 
 
 # utility function to parse incoming data (selects parser automatically)
 def parse(data, request, resource):
     charset = util.get_charset(request)
-    return manager.select_parser(request, resource).parse(data, charset)
+    parser = manager.select_parser(request, resource)
+    if hasattr(data, 'read') and not getattr(parser, 'parses_stream', False):
+        # parser can't handle streams, read everything in one go
+        data = data.read()
+    return parser.parse(data, charset)
 
 
 #
@@ -71,6 +71,16 @@ class Conflict(HttpStatusCodeError):
         HttpStatusCodeError.__init__(self, codes.CONFLICT, *args, **kw)
 
 
+class RequestEntityTooLarge(HttpStatusCodeError):
+    def __init__(self, *args, **kw):
+        HttpStatusCodeError.__init__(self, codes.REQUEST_ENTITY_TOO_LARGE, *args, **kw)
+
+
+class UnsupportedMediaType(HttpStatusCodeError):
+    def __init__(self, *args, **kw):
+        HttpStatusCodeError.__init__(self, codes.UNSUPPORTED_MEDIA_TYPE, *args, **kw)
+
+
 class InternalServerError(HttpStatusCodeError):
     def __init__(self, *args, **kw):
         HttpStatusCodeError.__init__(self, codes.INTERNAL_SERVER_ERROR, *args, **kw)
@@ -3,8 +3,53 @@
 #
 
 
-from copy import deepcopy
 from django.core.exceptions import ValidationError
+from .representation import BaseRepresentation
+
+
+class FactoryPlan(object):
+    """ Precompiled per-field steps of a factory for its spec.
+
+    Resolving the serializer function (``serialize_foo`` of the factory or
+    ``serialize`` of the field), the creator function (``create_foo`` of the
+    factory or ``clean`` of the field), property name and ``required`` flag
+    of each field is done once here instead of for every entity.
+    """
+
+    def __init__(self, factory):
+        spec = factory.spec
+        name_map = factory.property_name_map
+        #: the spec, its fields and the name map this plan was compiled for
+        self.spec = spec
+        self.fields = dict(spec.fields)
+        self.property_name_map = name_map
+        #: ``(name, property_name, serialize_func, required)`` for each field
+        self.serializers = tuple(
+            (name, name_map[name], factory._get_serialize_func(name, spec), field.required)
+            for name, field in spec.fields.items())
+        #: does the factory override ``_get_value_for_serialization()``?
+        self.custom_getter = type(factory)._get_value_for_serialization != \
+            Factory._get_value_for_serialization
+        #: ``(name, property_name, create_func, clean)`` for each field where
+        #: ``create_func`` is the factory's ``create_foo`` or ``None``
+        self.creators = tuple(
+            (name, name_map[name], getattr(factory, 'create_' + name, None), field.clean)
+            for name, field in spec.fields.items())
+        #: does the factory override ``_create_value()``?
+        self.custom_creator = type(factory)._create_value != Factory._create_value
+        #: names of the properties allowed in the incoming data
+        self.names = frozenset(name_map)
+        #: does ``create()`` clean every field like ``spec.validate()`` does?
+        self.validates_spec = not self.custom_creator and \
+            not any(create_func for _, _, create_func, _ in self.creators) and \
+            type(spec).validate == BaseRepresentation.validate and \
+            type(spec)._getData == BaseRepresentation._getData
+
+    def is_valid_for(self, factory):
+        """ Return ``True`` if the factory's spec hasn't changed. """
+        return self.spec is factory.spec and \
+            self.property_name_map is factory.property_name_map and \
+            self.fields == factory.spec.fields
 
 
 class Factory(object):
@@ -48,6 +93,8 @@ class Factory(object):
     #: todo: do we really need this?
     default_create_values = {}
 
+    _plan = None
+
     def __init__(
         self,
         klass=None,
@@ -67,9 +114,10 @@ class Factory(object):
             self.spec = spec
         if prevent_extra_fields is not None:
             self.prevent_extra_fields = prevent_extra_fields
-        # generate key name mappings
+        # generate key name mappings and compile the plan
         if self.spec:
             self.property_name_map = self._create_mappings(self.spec)
+            self._plan = FactoryPlan(self)
 
     def create(self, data):
         """ Create object from the given data.
@@ -93,11 +141,21 @@ class Factory(object):
 
         prototype = {}
         errors = {}
+        spec = self.spec
+        plan = self._get_plan()
+        create_value = self._create_value if plan.custom_creator else None
+        get = data.get
 
         # create and populate the prototype
-        for field_name, field_spec in self.spec.fields.items():
+        for field_name, key_name, create_func, clean in plan.creators:
             try:
-                value = self._create_value(data, field_name, self.spec)
+                if create_value:
+                    value = create_value(data, field_name, spec)
+                elif create_func:
+                    # this factory has a special creator function for this field
+                    value = create_func(data, field_name, spec)
+                else:
+                    value = clean(get(field_name))
             except ValidationError, e:
                 if field_name not in self.default_create_values:
                     if hasattr(e, 'message_dict'):
@@ -108,22 +166,18 @@ class Factory(object):
                     else:
                         errors[field_name] = e.messages
             else:
-                key_name = self.property_name_map[field_name]
                 prototype[key_name] = value
 
         # check extra fields
-        if self.prevent_extra_fields:
-            extras = set(data.keys()) - set(self.property_name_map.keys())
-            if extras:
-                errors[', '.join(extras)] = ['field(s) not allowed']
+        if self.prevent_extra_fields and not plan.names.issuperset(data):
+            extras = set(data) - plan.names
+            errors[', '.join(extras)] = ['field(s) not allowed']
 
         # if errors, raise ValidationError
         if errors:
             raise ValidationError(errors)
 
         # return dict or object based on the prototype
-        _data = deepcopy(self.default_create_values)
-        _data.update(prototype)
         if self.klass:
             instance = self.klass()
             instance.__dict__.update(prototype)
@@ -140,19 +194,21 @@ class Factory(object):
         :returns: dictionary
         """
 
-        def should_we_insert(value, field_spec):
-            return value not in self.missing or field_spec.required
-
         errors = {}
         ret = {}
+        plan = self._get_plan()
+        missing = self.missing
+        get_value = self._get_value_for_serialization if plan.custom_getter else None
 
-        for field_name, field_spec in self.spec.fields.items():
-            value = self._get_value_for_serialization(entity, field_name, field_spec)
-            func = self._get_serialize_func(field_name, self.spec)
+        for field_name, prop_name, func, required in plan.serializers:
+            if get_value:
+                value = get_value(entity, field_name, self.spec.fields[field_name])
+            else:
+                value = getattr(entity, prop_name, None)
             try:
                 # perform serialization
                 value = func(value, entity, request)
-                if should_we_insert(value, field_spec):
+                if required or value not in missing:
                     ret[field_name] = value
             except ValidationError, e:
                 if hasattr(e, 'message_dict'):
@@ -168,6 +224,25 @@ class Factory(object):
 
         return None if ret == {} else ret
 
+    def validates(self, spec):
+        """ Return ``True`` if ``create()`` validates like ``spec.validate()``.
+
+        This is the case when ``spec`` is the spec of this factory, all
+        fields are created using their ``clean()`` and extra fields are
+        prevented. Then, for a ``dict``, ``create()`` succeeds if and only
+        if ``spec.validate()`` succeeds and there's no need to do both.
+        """
+
+        return spec is self.spec and self.prevent_extra_fields and \
+            not self.default_create_values and self._get_plan().validates_spec
+
+    def _get_plan(self):
+        """ Return the compiled plan, recompiling it if the spec changed. """
+        plan = self._plan
+        if plan is None or not plan.is_valid_for(self):
+            plan = self._plan = FactoryPlan(self)
+        return plan
+
     def _create_value(self, data, name, spec):
         """ Create the value for a field.
 
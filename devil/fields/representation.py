@@ -10,6 +10,23 @@ from django.core.exceptions import ValidationError
 __all__ = ('Representation',)
 
 
+class ValidationPlan(object):
+    """ Precompiled validation steps for a set of fields.
+
+    Representations compile this once (at class creation) so that
+    validating many items doesn't need to iterate the ``fields`` dictionary
+    or build sets for every item.
+    """
+
+    def __init__(self, fields):
+        #: snapshot of the fields this plan was compiled from
+        self.fields = dict(fields)
+        #: names of all allowed properties
+        self.names = frozenset(fields)
+        #: ``(name, clean)`` pairs for all fields
+        self.cleaners = tuple((name, field.clean) for name, field in fields.items())
+
+
 class BaseRepresentation(object):
     """ Base class for actual Representation class.
 
@@ -17,6 +34,8 @@ class BaseRepresentation(object):
     :class:`Representation`.
     """
 
+    _validation_plan = None
+
     def __init__(self):
         """ Create the ``fields`` property.
 
@@ -37,25 +56,40 @@ class BaseRepresentation(object):
         errors = {}
 
         data = self._getData(data)
+        plan = self._get_validation_plan()
+        get = data.get
 
         # validate each field, one by one
-        for name, field in self.fields.items():
+        for name, clean in plan.cleaners:
             try:
-                field.clean(data.get(name))
+                clean(get(name))
             except ValidationError, e:
                 errors[name] = e.messages
             except AttributeError, e:
                 raise ValidationError('data should be of type dict but is %s' % (type(data),))
 
         # check for extra fields
-        extras = set(data.keys()) - set(self.fields.keys())
-        if extras:
+        if not plan.names.issuperset(data):
+            extras = set(data) - plan.names
             errors[', '.join(extras)] = ['field(s) not allowed']
 
         # if errors, raise ValidationError
         if errors:
             raise ValidationError(errors)
 
+    def _get_validation_plan(self):
+        """ Return the validation plan for the current ``fields``.
+
+        The plan compiled at class creation is used as long as ``fields``
+        hasn't been modified. Otherwise, a new plan is compiled and stored
+        for this instance.
+        """
+
+        plan = self._validation_plan
+        if plan is None or plan.fields != self.fields:
+            plan = self._validation_plan = ValidationPlan(self.fields)
+        return plan
+
     def _getData(self, data):
         """ Check that data is acceptable and return it.
 
@@ -96,11 +130,13 @@ class RepresentationMeta(type):
     """ Metaclass for Representations.
 
     This will find all fields defined for a Representation and stick them
-    in a dictionary in ``base_fields`` property.
+    in a dictionary in ``base_fields`` property. Validation plan for the
+    fields is compiled here too.
     """
 
     def __new__(cls, name, bases, attrs):
         attrs['base_fields'] = get_declared_fields(bases, attrs)
+        attrs['_validation_plan'] = ValidationPlan(attrs['base_fields'])
         return super(RepresentationMeta, cls).__new__(cls, name, bases, attrs)
 
 
@@ -18,6 +18,8 @@ CODES = dict(
     NOT_ACCEPTABLE=('Not Acceptable', 406),
     CONFLICT=('Conflict/Duplicate', 409),
     NOT_HERE=('Gone', 410),
+    REQUEST_ENTITY_TOO_LARGE=('Request Entity Too Large', 413),
+    UNSUPPORTED_MEDIA_TYPE=('Unsupported Media Type', 415),
     INTERNAL_SERVER_ERROR=('Internal Server Error', 500),
     NOT_IMPLEMENTED=('Not Implemented', 501),
     THROTTLED=('Throttled', 503),
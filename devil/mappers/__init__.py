@@ -5,11 +5,17 @@
 
 from jsonmapper import JsonMapper
 from xmlmapper import XmlMapper
+from msgpackmapper import MsgPackMapper
+from ndjsonmapper import NdjsonMapper
+from csvmapper import CsvMapper
 
 
 __all__ = (
     JsonMapper,
     XmlMapper,
+    MsgPackMapper,
+    NdjsonMapper,
+    CsvMapper,
     )
 
 
@@ -0,0 +1,161 @@
+#  -*- coding: utf-8 -*-
+# csvmapper.py ---
+#
+# Created: Sun Oct 18 2026
+#
+
+
+import csv
+from copy import copy
+from itertools import chain
+from django.utils.encoding import smart_str
+from devil.datamapper import DataMapper
+from devil import errors
+
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+
+class CsvMapper(DataMapper):
+    """ CSV mapper for flat (tabular) data.
+
+    Formats a dictionary or a list of dictionaries into CSV with a header
+    row. Parses CSV with a header row into a list of dictionaries (values
+    are unicode strings, empty cells are empty strings).
+
+    The columns are, in the order of preference:
+      * the ``columns`` given to the constructor
+      * the fields of the resource's ``representation`` in the order they
+        were declared
+      * the keys of the first formatted item in alphabetical order
+
+    Values that don't have a column are left out.
+    """
+
+    content_type = 'text/csv'
+
+    _variants = None
+
+    def __init__(self, columns=None, dialect='excel'):
+        """ Initialize the mapper.
+
+        :param columns: names of the columns (in order). If ``None``, the
+                        columns are resolved when formatting.
+        :param dialect: ``csv`` module dialect
+        """
+
+        self.columns = tuple(columns) if columns is not None else None
+        self.dialect = dialect
+
+    def for_request(self, request, resource=None):
+        """ Return a mapper whose columns come from the resource. """
+
+        representation = getattr(resource, 'representation', None)
+        if self.columns is not None or not getattr(representation, 'fields', None):
+            return self
+        if self._variants is None:
+            self._variants = {}
+        try:
+            return self._variants[representation]
+        except KeyError:
+            variant = copy(self)
+            variant.columns = self._get_representation_columns(representation)
+            variant._variants = {}
+            self._variants[representation] = variant
+            return variant
+
+    def _format_data(self, data, charset):
+        if data is None or data == '':
+            return ''
+        return ''.join(self._format_data_stream(data, charset))
+
+    def _format_data_stream(self, items, charset):
+        """ Format the items into CSV one row at a time.
+
+        :raises: NotAcceptable if the data is not a dictionary or a list
+                 of dictionaries.
+        """
+
+        if isinstance(items, dict):
+            items = [items]
+        elif isinstance(items, basestring):
+            raise self._not_tabular(items)
+        try:
+            items = iter(items)
+        except TypeError:
+            raise self._not_tabular(items)
+        columns = self.columns
+        if columns is None:
+            # take the columns from the first item
+            try:
+                first = items.next()
+            except StopIteration:
+                return
+            if not isinstance(first, dict):
+                raise self._not_tabular(first)
+            columns = sorted(first)
+            items = chain((first,), items)
+
+        buf = StringIO.StringIO()
+        writer = csv.writer(buf, dialect=self.dialect)
+        writer.writerow([smart_str(column, charset) for column in columns])
+        yield self._flush(buf)
+        for item in items:
+            if not isinstance(item, dict):
+                raise self._not_tabular(item)
+            writer.writerow([self._format_value(item.get(column), charset)
+                             for column in columns])
+            yield self._flush(buf)
+
+    def _format_value(self, value, charset):
+        """ Format a single cell value. """
+        if value is None:
+            return ''
+        return smart_str(value, charset)
+
+    def _parse_data(self, data, charset):
+        """ Parse the CSV data into a list of dictionaries. """
+
+        reader = csv.reader(StringIO.StringIO(data), dialect=self.dialect)
+        try:
+            rows = iter(reader)
+            try:
+                header = [self._decode_data(name, charset) for name in rows.next()]
+            except StopIteration:
+                return []
+            result = []
+            for row in rows:
+                if not row:
+                    continue
+                if len(row) > len(header):
+                    raise errors.BadRequest(
+                        'too many values on line %d' % (reader.line_num,))
+                result.append(dict(zip(
+                    header, [self._decode_data(value, charset) for value in row])))
+            return result
+        except csv.Error, exc:
+            raise errors.BadRequest('unable to parse data: %s' % (str(exc),))
+
+    def _not_tabular(self, data):
+        """ Return the error for data that can't be presented as CSV. """
+        return errors.NotAcceptable(
+            'csv requires a dictionary or a list of dictionaries, not %s' % (
+                type(data).__name__,))
+
+    def _get_representation_columns(self, representation):
+        """ Return names of the representation's fields in declaration order. """
+        fields = representation.fields
+        return tuple(sorted(fields, key=lambda name: (
+            getattr(fields[name], 'creation_counter', 0), name)))
+
+    def _flush(self, buf):
+        """ Return the contents of the buffer and empty it. """
+        value = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return value
+
+#
+# csvmapper.py ends here
@@ -6,52 +6,277 @@
 #
 
 
-import simplejson as json
+from copy import copy
+from decimal import Decimal
+import json as stdlib_json
+from django.conf import settings
 from devil.datamapper import DataMapper
 from devil import errors
 
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JsonBackend(object):
+    """ Base class for adapters between ``JsonMapper`` and a JSON library.
+
+    All backends follow the same contract:
+      - ``dumps()`` returns the document as unicode (or str in ``charset``)
+        and encodes ``Decimal`` values as numbers
+      - ``loads()`` parses floats into ``Decimal`` when ``use_decimal``
+        is set and raises ``ValueError`` if the data is not valid JSON
+    """
+
+    #: name used for selecting the backend (e.g. in settings)
+    name = None
+    #: is the library installed?
+    available = False
+    #: is the library using its C extension?
+    accelerated = False
+    #: can the backend parse floats into ``Decimal``s?
+    supports_decimal = True
+    #: does the backend encode ``Decimal``s without losing precision?
+    exact_decimal = True
+    #: may the backend be picked automatically?
+    auto_select = True
+
+    def dumps(self, data, charset, pretty):
+        raise NotImplementedError()
+
+    def loads(self, data, charset, use_decimal):
+        raise NotImplementedError()
+
+
+class SimpleJsonBackend(JsonBackend):
+    """ simplejson, preferably with its C speedups. """
+
+    name = 'simplejson'
+    available = simplejson is not None
+    if available:
+        accelerated = simplejson.encoder.c_make_encoder is not None
+
+    def dumps(self, data, charset, pretty):
+        params = {
+            'ensure_ascii': False,
+            'encoding': charset,
+            'use_decimal': True,
+            }
+        if pretty:
+            params['indent'] = 4
+        else:
+            params['separators'] = (',', ':')
+        return simplejson.dumps(data, **params)
+
+    def loads(self, data, charset, use_decimal):
+        # obviously it's different to say use_decimal=False than
+        # it is to leave it out completely..
+        if use_decimal:
+            return simplejson.loads(data, charset, use_decimal=True)
+        return simplejson.loads(data, charset)
+
+
+class StdlibJsonBackend(JsonBackend):
+    """ Python's own json module (C accelerated in CPython). """
+
+    name = 'json'
+    available = True
+    accelerated = stdlib_json.encoder.c_make_encoder is not None
+    exact_decimal = False
+
+    def dumps(self, data, charset, pretty):
+        params = {
+            'ensure_ascii': False,
+            'encoding': charset,
+            'default': self._default,
+            }
+        if pretty:
+            params['indent'] = 4
+            # same as simplejson (no trailing whitespace)
+            params['separators'] = (',', ': ')
+        else:
+            params['separators'] = (',', ':')
+        return stdlib_json.dumps(data, **params)
+
+    def loads(self, data, charset, use_decimal):
+        if use_decimal:
+            return stdlib_json.loads(data, charset, parse_float=Decimal)
+        return stdlib_json.loads(data, charset)
+
+    def _default(self, obj):
+        """ Encode ``Decimal``s (via ``float``, so precision may be lost). """
+        if isinstance(obj, Decimal):
+            return float(obj)
+        raise TypeError('%r is not JSON serializable' % (obj,))
+
+
+class UJsonBackend(JsonBackend):
+    """ ujson, the fastest but with a few differences.
+
+    ``Decimal``s are encoded via ``float``, they can't be parsed and the
+    indentation differs slightly. Hence, this backend is only used when
+    selected explicitly.
+    """
+
+    name = 'ujson'
+    available = ujson is not None
+    accelerated = True
+    supports_decimal = False
+    exact_decimal = False
+    auto_select = False
+
+    def dumps(self, data, charset, pretty):
+        return ujson.dumps(data, ensure_ascii=False, indent=4 if pretty else 0).decode('utf-8')
+
+    def loads(self, data, charset, use_decimal):
+        if charset and isinstance(data, str) and \
+                charset.lower().replace('-', '') != 'utf8':
+            data = data.decode(charset)
+        return ujson.loads(data)
+
+
+#: all known backends in the order of preference
+backends = (SimpleJsonBackend(), StdlibJsonBackend(), UJsonBackend())
+
+
+def get_backend(name=None):
+    """ Return the JSON backend with the given name.
+
+    If ``name`` is ``None``, return the fastest available backend that
+    encodes ``Decimal``s exactly: the first accelerated one or, if none
+    is, the first available one. Backends that lose precision are used
+    only if no exact one is installed.
+
+    :raises: ValueError if the backend is unknown or not installed.
+    """
+
+    if name is None:
+        candidates = [b for b in backends if b.available and b.auto_select]
+        candidates = [b for b in candidates if b.exact_decimal] or candidates
+        for backend in candidates:
+            if backend.accelerated:
+                return backend
+        return candidates[0]
+    for backend in backends:
+        if backend.name == name and backend.available:
+            return backend
+    raise ValueError('json backend not available: %s' % (name,))
+
 
 class JsonMapper(DataMapper):
     content_type = 'application/json'
+    request_params = ('pretty',)
+
+    _variants = None
 
-    def __init__(self, use_decimal=False):
+    def __init__(self, use_decimal=False, pretty=None, backend=None):
         """ Initialize JSON mapper with appropriate use of numbers.
 
         :param use_decimal: ``True`` if numbers should be converted
                             into ``Decimal``s.
+        :param pretty: ``True`` for indented output, ``False`` for compact
+                       output. If ``None``, ``DEVIL_JSON_PRETTY`` from
+                       Django settings is used (``True`` by default).
+        :param backend: ``JsonBackend`` or its name. If ``None``,
+                        ``DEVIL_JSON_BACKEND`` from Django settings is used
+                        or, if not set, the fastest available backend.
         """
 
         self.use_decimal = use_decimal
+        self.pretty = pretty
+        self.backend = self._resolve_backend(backend) if backend else None
+
+    def for_request(self, request, resource=None):
+        """ Return the mapper to be used for formatting the request.
+
+        Client may override the output style with ``?pretty=1`` or
+        ``?pretty=0``.
+        """
+
+        pretty = None
+        if request.META.get('QUERY_STRING', True):
+            pretty = request.GET.get('pretty', None)
+        if pretty is None:
+            return self
+        pretty = pretty.lower() not in ('0', 'false', 'no')
+        if pretty == self._is_pretty():
+            return self
+        return self._get_variant(pretty)
 
     def _format_data(self, data, charset):
         if data is None or data == '':
             return u''
         else:
-            params = {
-                'indent': 4,
-                'ensure_ascii': False,
-                'encoding': charset,
-                }
-            self._maybe_add_use_decimal(params)
-            return json.dumps(data, **params)
+            return self._get_backend().dumps(data, charset, self._is_pretty())
+
+    def _format_data_stream(self, items, charset):
+        """ Format the items into a JSON array one item at a time.
+
+        Only the array brackets and separators are produced here, each
+        item is encoded separately as it is pulled from ``items``.
+        """
+
+        dumps = self._get_backend().dumps
+        pretty = self._is_pretty()
+        item_separator = ', ' if pretty else ','
+        separator = '['
+        for item in items:
+            yield self._encode_data(separator + dumps(item, charset, pretty))
+            separator = item_separator
+        yield ']' if separator is item_separator else '[]'
 
     def _parse_data(self, data, charset):
-        params = {}
-        self._maybe_add_use_decimal(params)
+        backend = self._get_backend()
         try:
-            return json.loads(data, charset, **params)
+            return backend.loads(data, charset, self.use_decimal)
         except ValueError, exc:
             raise errors.BadRequest('unable to parse data: %s' % (str(exc),))
 
-    def _maybe_add_use_decimal(self, params):
-        """ Maybe add ``use_decimal`` to the given parameters
+    def _get_backend(self):
+        """ Return the JSON backend (selected on first use if not given). """
+        if self.backend is None:
+            self.backend = self._resolve_backend(
+                getattr(settings, 'DEVIL_JSON_BACKEND', None))
+        return self.backend
+
+    def _resolve_backend(self, backend):
+        """ Return the backend object and check that it fits this mapper.
 
-        obviously it's different to say use_decimal=False than
-        it is to leave it out completely..
+        :param backend: ``JsonBackend``, its name or ``None`` for the
+                        fastest available backend.
+        :raises: ValueError if the backend can't be used.
         """
 
-        if self.use_decimal:
-            params['use_decimal'] = True
+        if not isinstance(backend, JsonBackend):
+            backend = get_backend(backend)
+        if self.use_decimal and not backend.supports_decimal:
+            raise ValueError('json backend %s does not support decimals' % (backend.name,))
+        return backend
+
+    def _is_pretty(self):
+        """ Return ``True`` if the output should be indented. """
+        if self.pretty is None:
+            return getattr(settings, 'DEVIL_JSON_PRETTY', True)
+        return self.pretty
+
+    def _get_variant(self, pretty):
+        """ Return a copy of this mapper with the given output style. """
+        if self._variants is None:
+            self._variants = {}
+        try:
+            return self._variants[pretty]
+        except KeyError:
+            variant = copy(self)
+            variant.pretty = pretty
+            variant._variants = {pretty: variant}
+            self._variants[pretty] = variant
+            return variant
 
 #
 # jsonmapper.py ends here
@@ -0,0 +1,91 @@
+#  -*- coding: utf-8 -*-
+# msgpackmapper.py ---
+#
+# Created: Sun Oct 18 2026
+#
+
+
+from decimal import Decimal
+from devil.datamapper import DataMapper
+from devil import errors
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class MsgPackMapper(DataMapper):
+    """ Binary MessagePack mapper.
+
+    Requires the ``msgpack`` package. Notes:
+      * Strings are always encoded in utf-8 (as the format requires) and
+        they are parsed into unicode objects.
+      * MessagePack has no decimal type so ``Decimal`` values are encoded
+        as floats (precision may be lost). When parsing, floats can be
+        converted back into ``Decimal``s just like with ``JsonMapper``.
+    """
+
+    content_type = 'application/x-msgpack'
+
+    #: is the msgpack library installed?
+    available = msgpack is not None
+
+    def __init__(self, use_decimal=False):
+        """ Initialize MessagePack mapper with appropriate use of numbers.
+
+        :param use_decimal: ``True`` if floats should be converted
+                            into ``Decimal``s.
+        :raises: ImportError if ``msgpack`` is not installed.
+        """
+
+        if not self.available:
+            raise ImportError('msgpack is not installed')
+        self.use_decimal = use_decimal
+
+    def _format_data(self, data, charset):
+        if data is None or data == '':
+            return ''
+        return msgpack.packb(data, use_bin_type=False, default=self._default)
+
+    def _parse_data(self, data, charset):
+        params = {'raw': False}
+        if self.use_decimal:
+            params['object_hook'] = self._map_to_decimal
+            params['list_hook'] = self._list_to_decimal
+        try:
+            data = msgpack.unpackb(data, **params)
+        except ValueError, exc:
+            raise errors.BadRequest('unable to parse data: %s' % (str(exc),))
+        if self.use_decimal and isinstance(data, float):
+            return self._to_decimal(data)
+        return data
+
+    def _get_content_type(self):
+        """ Return Content-Type header (binary data has no charset). """
+        return self.content_type
+
+    def _default(self, obj):
+        """ Encode ``Decimal``s (via ``float``, so precision may be lost). """
+        if isinstance(obj, Decimal):
+            return float(obj)
+        raise TypeError('%r is not MessagePack serializable' % (obj,))
+
+    def _map_to_decimal(self, obj):
+        """ Convert float values of a parsed map into ``Decimal``s. """
+        for key, value in obj.iteritems():
+            if isinstance(value, float):
+                obj[key] = self._to_decimal(value)
+        return obj
+
+    def _list_to_decimal(self, obj):
+        """ Convert float items of a parsed array into ``Decimal``s. """
+        return [self._to_decimal(item) if isinstance(item, float) else item
+                for item in obj]
+
+    def _to_decimal(self, value):
+        """ Convert float into ``Decimal`` using its shortest repr. """
+        return Decimal(repr(value))
+
+#
+# msgpackmapper.py ends here
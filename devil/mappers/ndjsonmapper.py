@@ -0,0 +1,99 @@
+#  -*- coding: utf-8 -*-
+# ndjsonmapper.py ---
+#
+# Created: Sun Oct 18 2026
+#
+
+
+from devil.mappers.jsonmapper import JsonMapper
+from devil import errors
+
+
+class NdjsonMapper(JsonMapper):
+    """ Newline delimited JSON mapper (one JSON document per line).
+
+    Parsing produces an iterator that reads and parses the data one line
+    at a time (empty lines are skipped), so the whole document is never
+    in memory. Lists are formatted one item per line, anything else
+    as a single line. Output is always compact.
+    """
+
+    content_type = 'application/x-ndjson'
+    parses_stream = True
+    request_params = ()
+
+    #: size of the chunks read from the input stream
+    chunk_size = 64 * 1024
+
+    def __init__(self, use_decimal=False, backend=None):
+        """ Initialize the mapper.
+
+        :param use_decimal: ``True`` if numbers should be converted
+                            into ``Decimal``s.
+        :param backend: ``JsonBackend`` or its name (see ``JsonMapper``).
+        """
+
+        super(NdjsonMapper, self).__init__(
+            use_decimal=use_decimal, pretty=False, backend=backend)
+
+    def for_request(self, request, resource=None):
+        """ Output can't be indented, ignore ``?pretty``. """
+        return self
+
+    def _format_data(self, data, charset):
+        if data is None or data == '':
+            return u''
+        if not isinstance(data, (list, tuple)):
+            data = [data]
+        return ''.join(self._format_lines(data, charset))
+
+    def _format_data_stream(self, items, charset):
+        """ Format the items one line at a time. """
+        for line in self._format_lines(items, charset):
+            yield self._encode_data(line)
+
+    def _format_lines(self, items, charset):
+        dumps = self._get_backend().dumps
+        for item in items:
+            yield dumps(item, charset, False) + '\n'
+
+    def _parse_data(self, data, charset):
+        """ Return an iterator over the parsed lines.
+
+        Errors are raised only when the iterator is consumed.
+        """
+
+        return self._parse_lines(data, charset)
+
+    def _parse_lines(self, data, charset):
+        loads = self._get_backend().loads
+        for num, line in enumerate(self._iter_lines(data), 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield loads(line, charset, self.use_decimal)
+            except ValueError, exc:
+                raise errors.BadRequest(
+                    'unable to parse line %d: %s' % (num, str(exc)))
+
+    def _iter_lines(self, data):
+        """ Split the data (string or file-like object) into lines. """
+
+        if isinstance(data, basestring):
+            for line in data.split('\n'):
+                yield line
+            return
+        pending = ''
+        while True:
+            chunk = data.read(self.chunk_size)
+            if not chunk:
+                break
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line
+        yield pending
+
+#
+# ndjsonmapper.py ends here
@@ -9,15 +9,11 @@
 import types
 from decimal import Decimal, InvalidOperation
 import xml.sax.handler
-from django.utils.xmlutils import SimplerXMLGenerator
+from xml.parsers import expat
+from xml.sax.saxutils import escape
 from django.utils.encoding import smart_unicode
 from devil.datamapper import DataMapper
 
-try:
-    import cStringIO as StringIO
-except ImportError:
-    import StringIO
-
 
 class XmlMapper(DataMapper):
     """ Naïve XML mapper.
@@ -53,26 +49,49 @@ class XmlMapper(DataMapper):
       * When parsing, numbers can be left as strings, or they can be mapped
         to basic types ``int`` and ``float`` or alternatively to ``Decimal``.
         This can be controlled with the constructor parameter of this class.
+      * The xml is parsed either through ``xml.sax`` (the default) or
+        by driving ``xml.parsers.expat`` directly, which skips the SAX
+        layer and is faster on large documents. Both produce the same data.
     """
 
     content_type = 'text/xml'
+    parses_stream = True
 
-    def __init__(self, numbermode=None):
+    #: supported parser backends
+    parsers = ('sax', 'expat')
+
+    #: maximum number of element names whose tags are cached
+    tag_cache_size = 1024
+
+    def __init__(self, numbermode=None, parser='sax'):
         """ Initialize the parser.
 
         :param numbermode: supported values are ``None``, 'basic' or 'decimal'
+        :param parser: parser backend, 'sax' or 'expat'
+        :raises ValueError: if the parser backend is unknown
         """
 
+        if parser not in self.parsers:
+            raise ValueError('unknown xml parser: %s' % (parser,))
         self._numbermode = numbermode
+        self._parser = parser
+        # element name -> (start tag, end tag)
+        self._tags = {}
+        # parent element name -> list item element name
+        self._list_item_names = {}
 
     def _parse_data(self, data, charset):
         """ Parse the xml data into dictionary. """
 
-        builder = TreeBuilder(numbermode=self._numbermode)
-        if isinstance(data,basestring):
-            xml.sax.parseString(data, builder)
+        if self._parser == 'expat':
+            builder = ExpatTreeBuilder(numbermode=self._numbermode)
+            builder.parse(data)
         else:
-            xml.sax.parse(data, builder)
+            builder = TreeBuilder(numbermode=self._numbermode)
+            if isinstance(data, basestring):
+                xml.sax.parseString(data, builder)
+            else:
+                xml.sax.parse(data, builder)
         return builder.root[self._root_element_name()]
 
     def _format_data(self, data, charset):
@@ -81,41 +100,86 @@ class XmlMapper(DataMapper):
         if data is None or data == '':
             return u''
 
-        stream = StringIO.StringIO()
-        xml = SimplerXMLGenerator(stream, charset)
-        xml.startDocument()
-        xml.startElement(self._root_element_name(), {})
-        self._to_xml(xml, data)
-        xml.endElement(self._root_element_name())
-        xml.endDocument()
-        return stream.getvalue()
+        chunks = []
+        write = chunks.append
+        start, end = self._get_tags(self._root_element_name())
+        write(self._get_xml_declaration(charset))
+        write(start)
+        self._to_xml(write, data)
+        write(end)
+        return u''.join(chunks).encode(charset, 'xmlcharrefreplace')
+
+    def _format_data_stream(self, items, charset):
+        """ Format the items into XML document one item at a time.
 
-    def _to_xml(self, xml, data, key=None):
+        The result is the same as formatting the items as a list with
+        ``_format_data()``.
+        """
+
+        start, end = self._get_tags(self._root_element_name())
+        item_start, item_end = self._get_tags(self._get_list_item_element_name(None))
+        yield (self._get_xml_declaration(charset) + start).encode(charset)
+        for item in items:
+            chunks = [item_start]
+            self._to_xml(chunks.append, item)
+            chunks.append(item_end)
+            yield u''.join(chunks).encode(charset, 'xmlcharrefreplace')
+        yield end.encode(charset)
+
+    def _to_xml(self, write, data, key=None):
         """ Recursively convert the data into xml.
 
         This function was originally copied from the
         `Piston project <https://bitbucket.org/jespern/django-piston/>`_
         It has been modified since.
 
-        :param xml: the xml document
-        :type xml: SimplerXMLGenerator
+        :param write: function that takes the next (unicode) chunk of the
+                      xml document
         :param data: data to be formatted
         :param key: name of the parent element (for root this is ``None``)
         """
 
         if isinstance(data, (list, tuple)):
+            start, end = self._get_tags(self._get_list_item_element_name(key))
             for item in data:
-                elemname = self._list_item_element_name(key)
-                xml.startElement(elemname, {})
-                self._to_xml(xml, item)
-                xml.endElement(elemname)
+                write(start)
+                self._to_xml(write, item)
+                write(end)
         elif isinstance(data, dict):
             for key, value in data.iteritems():
-                xml.startElement(key, {})
-                self._to_xml(xml, value, key)
-                xml.endElement(key)
+                start, end = self._get_tags(key)
+                write(start)
+                self._to_xml(write, value, key)
+                write(end)
+        elif isinstance(data, unicode):
+            write(escape(data))
         else:
-            xml.characters(smart_unicode(data))
+            write(escape(smart_unicode(data)))
+
+    def _get_xml_declaration(self, charset):
+        """ Return the xml declaration that starts the document. """
+        return u'<?xml version="1.0" encoding="%s"?>\n' % (charset,)
+
+    def _get_tags(self, name):
+        """ Return start and end tags for an element (cached). """
+        try:
+            return self._tags[name]
+        except KeyError:
+            uname = smart_unicode(name)
+            tags = (u'<%s>' % (uname,), u'</%s>' % (uname,))
+            if len(self._tags) < self.tag_cache_size:
+                self._tags[name] = tags
+            return tags
+
+    def _get_list_item_element_name(self, key):
+        """ Return cached result of ``_list_item_element_name()``. """
+        try:
+            return self._list_item_names[key]
+        except KeyError:
+            name = self._list_item_element_name(key)
+            if len(self._list_item_names) < self.tag_cache_size:
+                self._list_item_names[key] = name
+            return name
 
     def _root_element_name(self):
         """ Return the name of the xml root element.
@@ -138,7 +202,7 @@ class XmlMapper(DataMapper):
                 <volume_item>56</volume_item>
             </volumes>
 
-        @todo memoize perhaps..
+        The result is cached per ``key``.
         """
 
         key = key or ''
@@ -249,5 +313,60 @@ class TreeBuilder(xml.sax.handler.ContentHandler):
             node[name] = value
         return node
 
+
+class ExpatTreeBuilder(TreeBuilder):
+    """ Builder that is driven directly by ``xml.parsers.expat``.
+
+    Produces the same data as ``TreeBuilder`` under ``xml.sax`` but
+    skips the SAX layer: expat calls the handlers directly, character
+    data is buffered by expat and the tree is built with local closures
+    instead of attribute lookups on every element.
+    """
+
+    def parse(self, data):
+        """ Parse the xml data and store the result into ``self.root``.
+
+        :param data: xml as a string or a file-like object
+        :raises expat.ExpatError: if the xml is not well-formed
+        """
+
+        parse_node_data = self._parse_node_data
+        # each frame is [node, chardata] of an open element
+        frames = [[self.root, []]]
+        push = frames.append
+        pop = frames.pop
+
+        def start_element(name, attrs):
+            push([{}, []])
+
+        def end_element(name):
+            node, chardata = pop()
+            if not node:
+                # text only node
+                node = parse_node_data(u''.join(chardata).strip())
+            parent = frames[-1]
+            target = parent[0]
+            if isinstance(target, list):
+                target.append(node)
+            elif name in target:
+                # there's already an element with same name -> convert into list
+                parent[0] = target.values() + [node]
+            else:
+                target[name] = node
+
+        def characters(content):
+            frames[-1][1].append(content)
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = characters
+        if isinstance(data, basestring):
+            parser.Parse(data, True)
+        else:
+            parser.ParseFile(data)
+        self.root = frames[0][0]
+
 #
 # xml.py ends here
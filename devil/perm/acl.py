@@ -6,15 +6,40 @@
 #
 
 
+import uuid
+import weakref
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from devil import errors
+from devil.auth import get_user_model
 
 
 class PermissionController(object):
-    """ Permission based access conttoller. """
+    """ Permission based access conttoller.
+
+    The permission names of a user are collected into a set once per
+    user object (i.e. per request). If a ``cache`` is given, the sets
+    are also cached across requests. Any change to permissions, groups
+    or their members invalidates the whole cache.
+    """
 
     PREFIX = 'resource'
     METHODS = ('post', 'get', 'put', 'delete')
 
+    # resource -> (name function, {method: permission name})
+    _resource_perm_names = None
+
+    def __init__(self, cache=None):
+        """ Initialize the controller.
+
+        @param cache cache for users' permission sets, e.g.
+                     ``devil.cache.LocalCache``. ``None`` disables caching
+                     across requests.
+        """
+
+        self.cache = cache
+        if cache is not None:
+            self._connect_signals()
+
     @classmethod
     def get_perm_names(cls, resource):
         """ Return all permissions supported by the resource.
@@ -46,10 +71,33 @@ class PermissionController(object):
         @raise Forbidden if the user doesn't have access to the resource
         """
 
-        perm_name = self.get_perm_name(resource, request.method)
+        perm_name = self._get_resource_perm_names(resource).get(request.method.lower())
+        if perm_name is None:
+            perm_name = self.get_perm_name(resource, request.method)
         if not self._has_perm(request.user, perm_name):
             raise errors.Forbidden()
 
+    def _get_resource_perm_names(self, resource):
+        """ Return the permission names of the resource for all ``METHODS``.
+
+        The names are computed once per resource and recomputed only if
+        the resource's ``name()`` is replaced.
+
+        @return dictionary of lowercase method names and permission names
+        """
+
+        name_func = getattr(resource.name, 'im_func', resource.name)
+        if self._resource_perm_names is None:
+            # don't keep resources alive
+            self._resource_perm_names = weakref.WeakKeyDictionary()
+        entry = self._resource_perm_names.get(resource)
+        if entry is not None and entry[0] is name_func:
+            return entry[1]
+        perm_names = dict((method, self.get_perm_name(resource, method))
+                          for method in self.METHODS)
+        self._resource_perm_names[resource] = (name_func, perm_names)
+        return perm_names
+
     def _has_perm(self, user, permission):
         """ Check whether the user has the given permission
 
@@ -59,10 +107,64 @@ class PermissionController(object):
         if user.is_superuser:
             return True
         if user.is_active:
-            perms = [perm.split('.')[1] for perm in user.get_all_permissions()]
-            return permission in perms
+            return permission in self._get_perm_names(user)
         return False
 
+    def _get_perm_names(self, user):
+        """ Return the names of all permissions the user has.
+
+        @return ``frozenset`` of permission codenames
+        """
+
+        try:
+            return user._devil_perm_names
+        except AttributeError:
+            pass
+
+        names = None
+        if self.cache is not None:
+            key = ('devil-perms', self._get_generation(), user.pk)
+            names = self.cache.get(key)
+        if names is None:
+            names = frozenset(
+                perm.split('.')[1] for perm in user.get_all_permissions())
+            if self.cache is not None:
+                self.cache.set(key, names)
+        user._devil_perm_names = names
+        return names
+
+    def invalidate(self):
+        """ Forget all cached permission sets. """
+        if self.cache is not None:
+            self.cache.set(('devil-perms-generation',), uuid.uuid4().hex)
+
+    def _get_generation(self):
+        """ Return the generation of the cached permission sets. """
+
+        key = ('devil-perms-generation',)
+        generation = self.cache.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.cache.set(key, generation)
+        return generation
+
+    def _connect_signals(self):
+        """ Invalidate the cache when permissions or groups change. """
+
+        from django.contrib.auth.models import Group, Permission
+        user_model = get_user_model()
+        for through in (user_model.user_permissions.through,
+                        user_model.groups.through,
+                        Group.permissions.through):
+            m2m_changed.connect(self._permissions_changed, sender=through)
+        for model in (Permission, Group):
+            post_save.connect(self._permissions_changed, sender=model)
+            post_delete.connect(self._permissions_changed, sender=model)
+
+    def _permissions_changed(self, sender, **kw):
+        """ Signal handler for changed permissions. """
+        self.invalidate()
+
     @classmethod
     def _get_resource_name(self, resource):
         """ Return the name of the resource.
@@ -6,7 +6,9 @@
 #
 
 
+import sys
 import types
+from django.db import router, transaction
 from django.db.models import signals
 from django.db.utils import IntegrityError
 from devil.resource import Resource
@@ -104,6 +106,15 @@ def _ensure_content_type():
     return row.id
 
 
+def _get_content_type():
+    """ Return id of the devil content type or ``None`` if it's missing. """
+    from django.contrib.contenttypes.models import ContentType
+    try:
+        return ContentType.objects.get(app_label=PERM_APP_NAME).id
+    except ContentType.DoesNotExist:
+        return None
+
+
 def _get_permission_description(permission_name):
     """ Generate a descriptive string based on the permission name.
 
@@ -119,39 +130,114 @@ def _get_permission_description(permission_name):
     return 'Can %s %s' % (method.upper(), resource)
 
 
-def _save_new_permission(perm, content_type_id):
+def _new_permission(perm, content_type_id):
+    from django.contrib.auth.models import Permission
+    return Permission(
+        name=_get_permission_description(perm),
+        content_type_id=content_type_id,
+        codename=perm)
+
+
+def _try_insert(insert):
+    """ Call ``insert``, return ``False`` if it violates a constraint.
+
+    The insert is done in a savepoint so that a failure doesn't abort
+    the surrounding transaction (as it would on PostgreSQL).
+    """
+
     from django.contrib.auth.models import Permission
+    using = router.db_for_write(Permission)
+    sid = transaction.savepoint(using=using)
     try:
-        Permission(
-            name=_get_permission_description(perm),
-            content_type_id=content_type_id,
-            codename=perm).save()
+        insert()
     except IntegrityError:
-        pass
+        transaction.savepoint_rollback(sid, using=using)
+        return False
+    transaction.savepoint_commit(sid, using=using)
+    return True
 
 
-def _populate_permissions(resources, content_type_id):
-    """ Add all missing permissions to the database. """
+def _save_new_permission(perm, content_type_id):
+    _try_insert(_new_permission(perm, content_type_id).save)
+
+
+def _get_missing_permissions(resources, content_type_id):
+    """ Return names of the resources' permissions that are not in db.
+
+    The names are in the order of the resources (without duplicates).
+    """
+
     from django.contrib.auth.models import Permission
-    # read the whole auth_permission table into memory
-    db_perms = [perm.codename for perm in Permission.objects.all()]
+    if content_type_id is None:
+        db_perms = set()
+    else:
+        db_perms = set(Permission.objects.filter(
+            content_type_id=content_type_id).values_list('codename', flat=True))
 
+    missing = []
     for resource in resources:
-        # get all resource's permissions that are not already in db
-        perms = [perm for perm in resource.access_controller.get_perm_names(resource) if perm not in db_perms]
+        for perm in resource.access_controller.get_perm_names(resource):
+            if perm not in db_perms:
+                db_perms.add(perm)
+                missing.append(perm)
+    return missing
+
+
+def _populate_permissions(resources, content_type_id, dry_run=False):
+    """ Add all missing permissions to the database.
+
+    The permissions are inserted with a single query. If that fails
+    (e.g. someone else inserted some of them meanwhile), they are
+    inserted one at a time skipping the existing ones.
+
+    :param dry_run: if ``True``, nothing is written into the database.
+    :returns: names of the permissions that were (or would be) added.
+    """
+
+    from django.contrib.auth.models import Permission
+    perms = _get_missing_permissions(resources, content_type_id)
+    if not perms or dry_run:
+        return perms
+
+    rows = [_new_permission(perm, content_type_id) for perm in perms]
+    if not _try_insert(lambda: Permission.objects.bulk_create(rows)):
         for perm in perms:
             _save_new_permission(perm, content_type_id)
+    return perms
 
 
-def _update_db(resources):
+def _update_db(resources, dry_run=False):
     """ Add the content type and all permissions if they are missing. """
-    content_type_id = _ensure_content_type()
-    _populate_permissions(resources, content_type_id)
+    if dry_run:
+        content_type_id = _get_content_type()
+    else:
+        content_type_id = _ensure_content_type()
+    return _populate_permissions(resources, content_type_id, dry_run)
+
+
+def sync_permissions(dry_run=False, verbosity=1, stdout=None):
+    """ Add the permissions of all ``ACL_RESOURCES`` into the database.
+
+    :param dry_run: if ``True``, only report what would be added (the
+                    report is written regardless of ``verbosity``).
+    :param verbosity: if at least 2, each added permission is reported
+    :param stdout: stream for the report (default: ``sys.stdout``)
+    :returns: names of the permissions that were (or would be) added.
+    """
+
+    perms = _update_db(get_resources(), dry_run)
+    if dry_run or verbosity >= 2:
+        stdout = stdout or sys.stdout
+        action = 'Would add' if dry_run else 'Adding'
+        for perm in perms:
+            stdout.write("%s permission '%s'\n" % (action, perm))
+        if dry_run and not perms:
+            stdout.write('No permissions to add\n')
+    return perms
 
 
 def update_permissions(app, created_models, verbosity=2, **kwargs):
-    resources = get_resources()
-    _update_db(resources)
+    sync_permissions(verbosity=verbosity)
 
 signals.post_syncdb.connect(update_permissions)
 
@@ -8,19 +8,29 @@
 
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import ValidationError
-from django.http import HttpResponse
+from django.http import HttpResponse, QueryDict
 from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 import errors
+import compression
 import datamapper
 import util
 from http import codes, Response
+import hashlib
 import logging
+import random
+import uuid
 
 
 # todo: move and make configurable
 REALM = 'devil'
 
 
+# bodies that django itself parses into request.POST
+_form_content_types = ('multipart/form-data', 'application/x-www-form-urlencoded')
+
+
 # todo: move somewhere and add note about borrowing this from piston
 def coerce_put_post(request):
     """
@@ -33,6 +43,12 @@ def coerce_put_post(request):
     in mod_python. This should fix it.
     """
     if request.method.upper() == "PUT":
+        if not request.META.get('CONTENT_TYPE', '').startswith(_form_content_types):
+            # devil's mappers parse the body, leave the stream unread so
+            # that it doesn't need to be in memory as a whole
+            request.PUT = QueryDict('', encoding=request.encoding)
+            return
+
         # Bug fix: if _load_post_and_files has already been called, for
         # example by middleware accessing request.POST, the below code to
         # pretend the request is a POST instead of a PUT will be too late
@@ -84,12 +100,34 @@ class Resource(object):
     post_factory = None
     default_mapper = None
     mapper = None
+    stream_response = False
+    max_input_size = None
+    input_chunk_size = 64 * 1024
+    max_decompressed_input_size = 16 * 1024 * 1024
+    output_validation = 'always'
+    compress_response = False
+    compress_min_size = 1024
+    etag = False
+    response_cache = None
+    response_cache_params = None
+    response_cache_per_user = True
+
+    def __init__(self):
+        """ Check the configuration of the resource.
+
+        :raises: ValueError if ``output_validation`` is not a valid policy.
+        """
+
+        self._check_output_validation(self.output_validation)
 
     def __call__(self, request, *args, **kw):
         """ Entry point for HTTP requests. """
 
-        coerce_put_post(request)  # django-fix
         try:
+            if self._is_data_method(request):
+                # before anything (e.g. authentication) reads the body
+                self._get_input_size(request)
+            coerce_put_post(request)  # django-fix
             return self.__handle_request(request, *args, **kw)
         except errors.HttpStatusCodeError, exc:
             return self._get_error_response(exc)
@@ -120,10 +158,185 @@ class Resource(object):
         self._authenticate(request)
         self._check_permission(request)
         method = self._get_method(request)
-        data = self._get_input_data(request)
-        data = self._clean_input_data(data, request)
-        response = self._exec_method(method, request, data, *args, **kw)
-        return self._process_response(response, request)
+        etag = self._get_version_etag(request, *args, **kw)
+        if etag and self._etag_matches(request, etag):
+            # client has the current version, no need to execute anything
+            return self._get_not_modified_response(etag)
+        cache_key = self._get_response_cache_key(request, *args, **kw)
+        response = self._get_cached_response(cache_key)
+        if response is None:
+            data = self._get_input_data(request)
+            data = self._clean_input_data(data, request)
+            response = self._exec_method(method, request, data, *args, **kw)
+            self._invalidate_response_cache(request)
+            response = self._process_response(response, request)
+            self._cache_response(cache_key, response)
+        return self._apply_etag(request, response, etag)
+
+    def content_version(self, request, *args, **kw):
+        """ Return the version of the content that ``get()`` would return.
+
+        Override to enable cheap conditional GETs: the version (e.g. a
+        modification timestamp or a revision number) is turned into a
+        weak ETag and if the client already has it, ``304 Not Modified``
+        is returned without calling ``get()`` at all. The version must
+        change whenever the content changes.
+
+        :param request: the HTTP request (and the URL arguments)
+        :returns: the version or ``None`` if it is not known
+        """
+
+        return None
+
+    def _get_version_etag(self, request, *args, **kw):
+        """ Return weak ETag from ``content_version()`` for GET requests. """
+
+        if request.method.upper() != 'GET':
+            return None
+        version = self.content_version(request, *args, **kw)
+        if version is None:
+            return None
+        return 'W/' + quote_etag(str(version))
+
+    def _apply_etag(self, request, response, etag):
+        """ Set the ETag header and check the ``If-None-Match`` header.
+
+        If there's no version ETag but ``self.etag`` is set, a strong ETag
+        is computed over the formatted body of successful GET responses.
+        Streamed responses don't get a strong ETag.
+
+        :param etag: the version ETag (or ``None``)
+        :returns: the response or ``304 Not Modified`` if the client
+                  already has the content.
+        """
+
+        if response.status_code != 200 or response.has_header('ETag'):
+            return response
+        if not etag:
+            if not self.etag or request.method.upper() != 'GET' or \
+                    getattr(response, 'streaming', False) or \
+                    getattr(response, '_base_content_is_iter', False):
+                return response
+            etag = quote_etag(hashlib.md5(response.content).hexdigest())
+            if self._etag_matches(request, etag):
+                return self._get_not_modified_response(etag, response)
+        response['ETag'] = etag
+        return response
+
+    def _etag_matches(self, request, etag):
+        """ Return ``True`` if ``If-None-Match`` matches the ETag.
+
+        Uses the weak comparison, as required for ``If-None-Match``.
+        """
+
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header:
+            return False
+        if header.strip() == '*':
+            return True
+        value = parse_etags(etag)[0]
+        return value in parse_etags(header)
+
+    def _get_not_modified_response(self, etag, response=None):
+        """ Return ``304 Not Modified`` response.
+
+        :param response: the full response whose ``Vary`` header (if any)
+                         is preserved.
+        """
+
+        res = HttpResponse(status=304)
+        del res['Content-Type']
+        res['ETag'] = etag
+        if response is not None and response.has_header('Vary'):
+            res['Vary'] = response['Vary']
+        return res
+
+    def _get_response_cache_key(self, request, *args, **kw):
+        """ Return the key for caching the response of a GET request.
+
+        The key consists of the resource, the URL arguments, the query
+        parameters (all of them or ``self.response_cache_params`` and the
+        mapper's ``request_params``), the selected mapper, the content
+        coding of the response, the user (unless
+        ``self.response_cache_per_user`` is ``False``) and the generation
+        of the resource (see ``_invalidate_response_cache()``).
+
+        Note that a lazily loaded ``request.user`` is loaded here.
+
+        :returns: the key or ``None`` if the response is not cached.
+        """
+
+        if self.response_cache is None or request.method.upper() != 'GET':
+            return None
+        try:
+            mapper = datamapper.manager.select_formatter(request, self)
+        except errors.NotAcceptable:
+            return None
+        names = self.response_cache_params
+        if names is None:
+            names = sorted(request.GET)
+        else:
+            names = tuple(names) + tuple(
+                name for name in getattr(mapper, 'request_params', ())
+                if name not in names)
+        params = tuple((name, tuple(request.GET.getlist(name))) for name in names)
+        encoding = None
+        if self.compress_response:
+            encoding = compression.select_encoding(
+                request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        user = None
+        if self.response_cache_per_user:
+            user = getattr(request, 'user', None)
+            user = user.pk if user and user.is_authenticated() else None
+        return (self.name(), self._get_response_cache_generation(), args,
+                tuple(sorted(kw.items())), params, mapper.content_type, encoding, user)
+
+    def _get_response_cache_generation(self):
+        """ Return the current generation of the cached responses. """
+
+        key = ('generation', self.name())
+        generation = self.response_cache.get(key)
+        if generation is None:
+            generation = uuid.uuid4().hex
+            self.response_cache.set(key, generation)
+        return generation
+
+    def _invalidate_response_cache(self, request):
+        """ Invalidate the cached responses after PUT, POST or DELETE.
+
+        Starting a new generation makes all the cached responses of this
+        resource unreachable. They are eventually evicted by the cache.
+        """
+
+        if self.response_cache is not None and \
+                request.method.upper() in ('PUT', 'POST', 'DELETE'):
+            self.response_cache.set(('generation', self.name()), uuid.uuid4().hex)
+
+    def _get_cached_response(self, key):
+        """ Return the cached response or ``None``. """
+
+        if key is None:
+            return None
+        entry = self.response_cache.get(key)
+        if entry is None:
+            return None
+        status_code, headers, content = entry
+        response = HttpResponse(content)
+        response.status_code = status_code
+        for name, value in headers:
+            response[name] = value
+        return response
+
+    def _cache_response(self, key, response):
+        """ Store successful, non-streamed response into the cache. """
+
+        if key is None or response.status_code != 200 or \
+                response.cookies or \
+                getattr(response, 'streaming', False) or \
+                getattr(response, '_base_content_is_iter', False):
+            return
+        self.response_cache.set(
+            key, (response.status_code, response.items(), response.content))
 
     def _exec_method(self, method, request, data, *args, **kw):
         """ Execute appropriate request handler. """
@@ -146,6 +359,10 @@ class Resource(object):
            - object (or list of objects) that are first serialized into dict
              using ``self.factory``.
            - plaintext
+           - iterable (e.g. generator) of dictionaries or objects, if
+             ``self.stream_response`` is set. The items are serialized,
+             validated and formatted one by one as the response is being
+             sent to the client.
         :returns: Django's ``HttpResponse``
         """
 
@@ -160,6 +377,8 @@ class Resource(object):
             return response
 
         devil_res = coerce_response()
+        if self._is_streamed_response(devil_res):
+            return self._stream_response(request, devil_res)
         if devil_res.content and devil_res.get_code_num() in (0, 200, 201):
             # serialize, format and validate
             serialized_res = devil_res.content = self._serialize_object(devil_res.content, request)
@@ -178,12 +397,98 @@ class Resource(object):
         """
 
         res = datamapper.format(request, response, self)
+        return self._complete_response(request, res, response)
+
+    def _stream_response(self, request, response):
+        """ Serialize, validate and format the response item by item.
+
+        Nothing is done to the items until the returned response is
+        consumed. Therefore, errors that occur during serialization or
+        validation can no longer change the status code of the response.
+        They are logged and the response is cut short.
+        """
+
+        response.content = self._iter_output_data(response.content, request)
+        res = datamapper.format_stream(request, response, self)
+        return self._complete_response(request, res, response)
+
+    def _complete_response(self, request, django_response, devil_response):
+        """ Set the default status code, apply the headers and compress. """
+
         # data is now formatted, let's check if the status_code is set
-        if res.status_code is 0:
-            res.status_code = 200
+        if django_response.status_code is 0:
+            django_response.status_code = 200
         # apply headers
-        self._add_resposne_headers(res, response)
-        return res
+        self._add_resposne_headers(django_response, devil_response)
+        if self.compress_response:
+            self._compress_response(request, django_response)
+        return django_response
+
+    def _compress_response(self, request, response):
+        """ Compress the response body if the client accepts it.
+
+        Bodies smaller than ``self.compress_min_size`` are left as they
+        are. Streamed bodies are always compressed, incrementally.
+        """
+
+        if response.has_header('Content-Encoding'):
+            # resource has encoded the content itself
+            return response
+        streaming = getattr(response, 'streaming', False)
+        # django < 1.5 streams responses whose content is an iterator
+        iterator = getattr(response, '_base_content_is_iter', False)
+        if not streaming and not iterator:
+            content = response.content
+            if not content or len(content) < self.compress_min_size:
+                return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.select_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if not encoding:
+            return response
+        if streaming:
+            response.streaming_content = compression.compress_stream(
+                response.streaming_content, encoding)
+        elif iterator:
+            response.content = compression.compress_stream(
+                response._container, encoding)
+        else:
+            response.content = compression.compress(content, encoding)
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = str(len(response.content))
+        response['Content-Encoding'] = encoding
+        return response
+
+    def _is_streamed_response(self, response):
+        """ Return ``True`` if the response should be streamed. """
+
+        if not self.stream_response:
+            return False
+        if response.get_code_num() not in (0, 200, 201):
+            return False
+        content = response.content
+        return hasattr(content, '__iter__') and \
+            not isinstance(content, (dict, basestring))
+
+    def _iter_output_data(self, items, request):
+        """ Serialize and validate response items one at a time. """
+
+        # querysets would cache all the rows when iterated
+        if hasattr(items, 'iterator') and callable(items.iterator):
+            items = items.iterator()
+        for item in items:
+            try:
+                serialized_item = self._serialize_object(item, request)
+                self._validate_output_data(
+                    item, serialized_item, None, request)
+            except Exception, exc:
+                logging.getLogger('devil').error(
+                    'while streaming %s on %s, devil caught: %s' % (
+                        request.method, request.path_info, str(exc)),
+                    exc_info=True)
+                raise
+            yield serialized_item
 
     def _add_resposne_headers(self, django_response, devil_response):
         """ Add response headers.
@@ -207,12 +512,85 @@ class Resource(object):
         if not self._is_data_method(request):
             return None
 
-        content = [row for row in request.read()]
-        content = ''.join(content) if content else None
-        return self._parse_input_data(content, request) if content else None
+        size = self._get_input_size(request)
+        if not size:
+            return None
+
+        # peek into the body; if all of it fits into the first chunk we
+        # have it in one buffer, otherwise the rest is left in the stream
+        # for the mapper to read (mappers that can't parse streams will
+        # read it in one go)
+        stream = self._get_input_stream(request)
+        if stream is request:
+            # a single read() may return less than asked, rely on the size
+            if size <= self.input_chunk_size:
+                content = self._read_input(stream, size)
+            else:
+                content = util.PrefixedStream(
+                    stream.read(self.input_chunk_size), stream)
+        else:
+            # decompressed size is not known, but the stream fills the
+            # chunk unless the data ends
+            content = stream.read(self.input_chunk_size)
+            if len(content) == self.input_chunk_size:
+                content = util.PrefixedStream(content, stream)
+        if not content:
+            return None
+        return self._parse_input_data(content, request)
+
+    def _read_input(self, stream, size):
+        """ Read ``size`` bytes (or until the data ends) from the stream. """
+
+        chunks = []
+        while size > 0:
+            chunk = stream.read(size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size -= len(chunk)
+        return ''.join(chunks)
+
+    def _get_input_stream(self, request):
+        """ Return file-like object for reading the request body.
+
+        Bodies compressed with gzip or deflate (``Content-Encoding``) are
+        decompressed while they are read.
+
+        :raises: UnsupportedMediaType if the content coding is not supported.
+        """
+
+        encoding = compression.normalize_encoding(
+            request.META.get('HTTP_CONTENT_ENCODING', ''))
+        if not encoding:
+            return request
+        if encoding not in compression.encodings:
+            raise errors.UnsupportedMediaType(
+                'unsupported content encoding: %s' % (encoding,))
+        return compression.DecompressingStream(
+            request, encoding, self.max_decompressed_input_size,
+            self.input_chunk_size)
+
+    def _get_input_size(self, request):
+        """ Return the size of the request body in bytes.
+
+        :raises: RequestEntityTooLarge if the body is larger than
+                 ``self.max_input_size``.
+        """
+
+        try:
+            size = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise errors.BadRequest('invalid Content-Length')
+        if self.max_input_size is not None and size > self.max_input_size:
+            raise errors.RequestEntityTooLarge(
+                'maximum size of request data is %d bytes' % (self.max_input_size,))
+        return size
 
     def _parse_input_data(self, data, request):
-        """ Execute appropriate parser. """
+        """ Execute appropriate parser.
+
+        :param data: the data either as a string or a file-like object.
+        """
         return datamapper.parse(data, request, self)
 
     def _clean_input_data(self, data, request):
@@ -223,20 +601,54 @@ class Resource(object):
             # this is not PUT or POST -> return
             return data
 
+        if self._is_streamed_input(data):
+            # mapper produced an iterator -> clean items as they are consumed
+            return self._iter_input_data(data, request)
+
         # do cleaning
         try:
-            if self.representation:
-                # representation defined -> perform validation
-                self._validate_input_data(data, request)
-            if self.factory:
-                # factory defined -> create object
-                return self._create_object(data, request)
-            else:
-                # no factory nor representation -> return the same data back
-                return data
+            return self._clean_data(data, request)
         except ValidationError, exc:
             return self._input_validation_failed(exc, data, request)
 
+    def _clean_data(self, data, request):
+        """ Validate the data and create the object(s).
+
+        :raises: ValidationError if the data is not valid
+        """
+
+        if self.representation:
+            if self._is_validated_by_factory(data, request):
+                # factory validates while creating -> single pass
+                return self._create_validated_object(data, request)
+            # representation defined -> perform validation
+            self._validate_input_data(data, request)
+        if self.factory:
+            # factory defined -> create object
+            return self._create_object(data, request)
+        else:
+            # no factory nor representation -> return the same data back
+            return data
+
+    def _is_streamed_input(self, data):
+        """ Return ``True`` if the parsed data is an iterator of items. """
+        return hasattr(data, '__iter__') and \
+            not isinstance(data, (list, tuple, dict, basestring))
+
+    def _iter_input_data(self, items, request):
+        """ Clean input items one at a time.
+
+        The items are cleaned only when the request handler consumes
+        them, so the validation errors are raised from within the
+        handler (and propagate out of it, unless caught).
+        """
+
+        for item in items:
+            try:
+                yield self._clean_data(item, request)
+            except ValidationError, exc:
+                yield self._input_validation_failed(exc, item, request)
+
     def _get_input_validator(self, request):
         """ Return appropriate input validator.
 
@@ -269,6 +681,42 @@ class Resource(object):
         else:
             return validator.validate(data)
 
+    def _is_validated_by_factory(self, data, request):
+        """ Return ``True`` if object creation alone validates the data.
+
+        This is possible when the factory's spec is the input validator
+        and the factory creates all fields by cleaning them (see
+        ``Factory.validates()``). Then each field needs to be cleaned only
+        once.
+        """
+
+        if not self.factory:
+            return False
+        if type(self)._validate_input_data != Resource._validate_input_data:
+            # custom validation
+            return False
+        factory = self._get_input_factory(request)
+        validates = getattr(factory, 'validates', None)
+        if not validates or not validates(self._get_input_validator(request)):
+            return False
+        if isinstance(data, (list, tuple)):
+            return all(isinstance(item, dict) for item in data)
+        return isinstance(data, dict)
+
+    def _create_validated_object(self, data, request):
+        """ Validate and create the object in a single pass.
+
+        If creation fails, the data is validated with the representation
+        so that the error is reported exactly as it would have been with
+        separate validation.
+        """
+
+        try:
+            return self._create_object(data, request)
+        except (ValidationError, AttributeError):
+            self._validate_input_data(data, request)
+            raise
+
     def _validate_output_data(
         self, original_res, serialized_res, formatted_res, request):
         """ Validate the response data.
@@ -282,7 +730,7 @@ class Resource(object):
         validator = self.representation
 
         # when not to validate...
-        if not validator:
+        if not validator or not self._should_validate_output(request):
             return
 
         try:
@@ -293,6 +741,48 @@ class Resource(object):
         except ValidationError, exc:
             self._output_validation_failed(exc, serialized_res, request)
 
+    def _should_validate_output(self, request):
+        """ Apply ``self.output_validation`` policy.
+
+        The policy is one of:
+          - ``'always'``: validate all outgoing data
+          - ``'debug'``: validate only when ``settings.DEBUG`` is set
+          - ``'factory'``: trust the factory, i.e. don't validate if the
+            data was serialized by ``self.factory``
+          - integer ``N`` (at least 1): validate randomly chosen 1/N of
+            the responses
+
+        The policy is checked when the resource is created. Setting
+        ``DEVIL_FORCE_OUTPUT_VALIDATION`` to ``True`` in Django settings
+        overrides the policy and everything is validated.
+
+        :returns: ``True`` if the outgoing data should be validated.
+        """
+
+        policy = self.output_validation
+        if getattr(settings, 'DEVIL_FORCE_OUTPUT_VALIDATION', False):
+            return True
+        elif policy == 'debug':
+            return settings.DEBUG
+        elif policy == 'factory':
+            return not self.factory
+        elif self._is_sampling_policy(policy):
+            return random.random() * policy < 1
+        else:
+            # 'always' (and anything invalid assigned after creation)
+            return True
+
+    def _check_output_validation(self, policy):
+        """ Raise ValueError if ``policy`` is not a valid policy. """
+        if policy not in ('always', 'debug', 'factory') and \
+                not self._is_sampling_policy(policy):
+            raise ValueError('unknown output validation policy: %r' % (policy,))
+
+    def _is_sampling_policy(self, policy):
+        """ Return ``True`` for integer policies (``bool`` is not one). """
+        return isinstance(policy, (int, long)) and \
+            not isinstance(policy, bool) and policy >= 1
+
     def _input_validation_failed(self, error, data, request):
         """ Always raises HttpStatusCodeError.
 
@@ -323,16 +813,25 @@ class Resource(object):
         that was given.
         """
 
-        if request.method.upper() == 'POST' and self.post_factory:
-            fac_func = self.post_factory.create
-        else:
-            fac_func = self.factory.create
+        fac_func = self._get_input_factory(request).create
 
         if isinstance(data, (list, tuple)):
             return map(fac_func, data)
         else:
             return fac_func(data)
 
+    def _get_input_factory(self, request):
+        """ Return appropriate factory for creating objects.
+
+        For POST requests, ``self.post_factory`` is returned
+        if it is present, ``self.factory`` otherwise.
+        """
+
+        if request.method.upper() == 'POST' and self.post_factory:
+            return self.post_factory
+        else:
+            return self.factory
+
     def _serialize_object(self, response_data, request):
         """ Create a python datatype from the given python object.
 
@@ -444,6 +943,11 @@ class Resource(object):
             except errors.Unauthorized, exc:
                 # http request doesn't carry any authentication information
                 anonymous_access(exc)
+            else:
+                # authenticators may load the user lazily, and the user
+                # may turn out to be anonymous (e.g. deactivated)
+                if not self.allow_anonymous and not request.user.is_authenticated():
+                    raise errors.Forbidden()
         else:
             # no authentication configured
             anonymous_access(errors.Forbidden())
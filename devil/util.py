@@ -56,41 +56,55 @@ def get_charset(request):
         return None
 
 
+class PrefixedStream(object):
+    """ Read-only file-like object that returns ``prefix`` before ``stream``.
+
+    This is used for peeking into a stream: the peeked data is given back
+    as the prefix so that no data is lost. Closing this object doesn't
+    close the underlying stream.
+    """
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        """ Read at most ``size`` bytes (everything if ``size`` < 0). """
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.stream.read(), ''
+            return data
+        if not self.prefix:
+            return self.stream.read(size)
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+    def close(self):
+        pass
+
+
 def parse_accept_header(accept):
     """ Parse the Accept header
 
-    todo: memoize
+    Note that ``DataMapperManager`` caches its decisions per Accept header
+    so this isn't called for every request.
 
     :returns: list with pairs of (media_type, q_value), ordered by q
     values.
     """
 
-    def parse_media_range(accept_item):
-        """ Parse media range and subtype """
-
-        return accept_item.split('/', 1)
-
-    def comparator(a, b):
-        """ Compare accept items a and b """
-
-        # first compare q values
-        result = -cmp(a[2], b[2])
-        if result is not 0:
-            # q values differ, no need to compare media types
-            return result
-
-        # parse media types and compare them (asterisks are lower in precedence)
-        mtype_a, subtype_a = parse_media_range(a[0])
-        mtype_b, subtype_b = parse_media_range(b[0])
-        if mtype_a == '*' and subtype_a == '*':
-            return 1
-        if mtype_b == '*' and subtype_b == '*':
-            return -1
-        if subtype_a == '*':
-            return 1
-        if subtype_b == '*':
-            return -1
-        return 0
+    def sort_key(accept_item):
+        """ Order by q values, asterisks are lower in precedence """
+
+        media_type = accept_item[0]
+        if media_type == '*/*':
+            wildcard = 2
+        elif media_type.endswith('/*'):
+            wildcard = 1
+        else:
+            wildcard = 0
+        return -accept_item[2], wildcard
 
     if not accept:
         return []
@@ -108,7 +122,7 @@ def parse_accept_header(accept):
             else:
                 media_params.append((key, value))
         result.append((media_type, tuple(media_params), q))
-    result.sort(comparator)
+    result.sort(key=sort_key)
     return result
 
 #
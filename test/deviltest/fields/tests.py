@@ -242,6 +242,96 @@ class FactoryTests(TestCase):
         self.assertFalse('subs' in d)
 
 
+class FactoryPlanTests(TestCase):
+    """ Test that factories resolve per-field functions only once """
+
+    class CountingFactory(Factory):
+        klass = Foo
+        spec = TestSpec()
+        lookups = 0
+
+        def _get_serialize_func(self, name, spec):
+            self.lookups += 1
+            return super(FactoryPlanTests.CountingFactory, self)._get_serialize_func(name, spec)
+
+    def test_serialize_lookups(self):
+        f = self.CountingFactory()
+        entities = []
+        for i in range(10):
+            e = Foo()
+            e.id = i
+            e.name = 'jedi'
+            e.rev1 = 'rev1'
+            entities.append(e)
+        result = map(f.serialize, entities)
+        self.assertEquals([d['id'] for d in result], range(10))
+        self.assertEquals(f.lookups, len(TestSpec.base_fields))
+
+    def test_create_extra_fields(self):
+        f = self.CountingFactory()
+        data = {'id': 1, 'name': 'jedi', 'rev1': 'rev1', 'sith': 'vader'}
+        try:
+            f.create(data)
+        except ValidationError, e:
+            self.assertEquals(e.message_dict, {'sith': ['field(s) not allowed']})
+        else:
+            self.fail('extra fields not detected')
+        del data['sith']
+        self.assertEquals(f.create(data).name, 'jedi')
+        f.prevent_extra_fields = False
+        data['sith'] = 'vader'
+        self.assertFalse(hasattr(f.create(data), 'sith'))
+
+    def test_spec_changed(self):
+        class NameSpec(Representation):
+            name = django_fields.CharField()
+
+        f = self.CountingFactory()
+        e = Foo()
+        e.id = 1
+        e.name = 'jedi'
+        e.rev1 = 'rev1'
+        self.assertEquals(f.serialize(e)['id'], 1)
+        f.spec = NameSpec()
+        f.property_name_map = f._create_mappings(f.spec)
+        self.assertEquals(f.serialize(e), {'name': 'jedi'})
+
+
+class RepresentationTests(TestCase):
+    """ Test validation of representations """
+
+    class MySpec(Representation):
+        name = django_fields.CharField(max_length=5)
+        age = django_fields.IntegerField(required=False)
+
+    def test_validate(self):
+        spec = self.MySpec()
+        spec.validate({'name': 'luke'})
+        spec.validate({'name': 'luke', 'age': 19})
+        self.assertRaises(ValidationError, spec.validate, {'name': 'skywalker'})
+        self.assertRaises(ValidationError, spec.validate, {'age': 19})
+
+    def test_extra_fields(self):
+        spec = self.MySpec()
+        try:
+            spec.validate({'name': 'luke', 'jedi': True, 'sith': False})
+        except ValidationError, e:
+            self.assertEquals(e.message_dict.values(), [['field(s) not allowed']])
+        else:
+            self.fail('extra fields not detected')
+
+    def test_modified_fields(self):
+        """ validation follows changes made to the fields of an instance """
+        spec = self.MySpec()
+        spec.fields['weight'] = django_fields.IntegerField()
+        del spec.fields['name']
+        spec.validate({'weight': 80})
+        self.assertRaises(ValidationError, spec.validate, {'name': 'luke', 'weight': 80})
+        self.assertRaises(ValidationError, spec.validate, {'age': 19})
+        # other instances are not affected
+        self.MySpec().validate({'name': 'luke'})
+
+
 class EnumFieldTests(TestCase):
 
     class MySpec(Representation):
@@ -13,11 +13,13 @@ from django.core.urlresolvers import reverse
 
 from devil.resource import Resource
 from devil.http import Response
-from devil.auth import HttpBasic
+from devil.auth import HttpBasic, HttpHmac
+from devil.cache import LocalCache
 from devil.perm.acl import PermissionController
 from devil.mappers.jsonmapper import JsonMapper
 from devil.mappers.xmlmapper import XmlMapper
 from devil import Representation
+from devil.fields import Factory
 from simple import representations, models
 
 
@@ -48,6 +50,29 @@ class MyAuthResource(Resource):
         return 'Hello, Auth!'
 
 
+class MyCachedAuthResource(MyAuthResource):
+    """ HTTP Basic authentication with cached results """
+
+    authentication = HttpBasic(cache=LocalCache(max_size=10, timeout=60))
+
+
+class MyHmacAuthResource(Resource):
+    """ Token and HMAC signature authentication """
+
+    authentication = HttpHmac(keys={'k1': 'secret', 'k2': 'other secret'})
+    allow_anonymous = False
+    max_input_size = 1024
+
+    def get(self, request, *args, **kw):
+        if 'user' in request.GET:
+            return request.user.username
+        return 'Hello, HMAC!'
+
+    def put(self, data, request, *args, **kw):
+        self.put_data = data
+        return request.user.username
+
+
 class MyAnonResource(Resource):
     """ Anonymous resource """
 
@@ -111,6 +136,12 @@ class MyEchoResource(Resource):
         return self.mydata
 
 
+class MyLimitedEchoResource(MyEchoResource):
+    """ Echo resource that only accepts small request bodies. """
+
+    max_input_size = 16
+
+
 class MyDecimalResource(Resource):
     """
     Return and accept decimal numbers.
@@ -190,6 +221,69 @@ class MyValidationResource(Resource):
             return {'name': 'Luke Skywalker'}
 
 
+class MyStreamResource(Resource):
+    """ Stream the items of a list response. """
+
+    class MyRepresentation(Representation):
+        name = forms.CharField(max_length=5)
+
+    representation = MyRepresentation()
+    stream_response = True
+
+    def get(self, request, *args, **kw):
+        names = request.GET.get('names', 'Luke,Shmi')
+        return ({'name': name} for name in names.split(',') if name)
+
+
+class MyCompressedResource(Resource):
+    """ Compress responses larger than 100 bytes. """
+
+    compress_response = True
+    compress_min_size = 100
+    stream_response = True
+
+    def get(self, request, *args, **kw):
+        size = int(request.GET.get('size', 200))
+        if 'stream' in request.GET:
+            return ({'name': 'x' * size} for i in range(3))
+        return {'name': 'x' * size}
+
+
+class MyVersionedResource(Resource):
+    """ Content with a version and a strong ETag when the version is unknown. """
+
+    etag = True
+    version = 1
+    calls = 0
+
+    def content_version(self, request, *args, **kw):
+        if 'noversion' in request.GET:
+            return None
+        return self.version
+
+    def get(self, request, *args, **kw):
+        self.calls += 1
+        return {'version': self.version}
+
+    def put(self, data, request, *args, **kw):
+        self.version += 1
+
+
+class MyCachedResource(Resource):
+    """ Count how many times the content is actually produced. """
+
+    response_cache = LocalCache(max_size=10, timeout=60)
+    response_cache_params = ('page',)
+    calls = 0
+
+    def get(self, request, *args, **kw):
+        self.calls += 1
+        return {'calls': self.calls, 'page': request.GET.get('page')}
+
+    def put(self, data, request, *args, **kw):
+        pass
+
+
 class MyDefaultMapperResource_1(Resource):
     """ Define a mapper and a default mapper. """
     mapper = JsonMapper()
@@ -225,6 +319,30 @@ class PersonFactory(object):
             }
 
 
+class CountingCharField(forms.CharField):
+    """ Char field that counts how many times it has been cleaned. """
+
+    cleaned = 0
+
+    def clean(self, value):
+        CountingCharField.cleaned += 1
+        return super(CountingCharField, self).clean(value)
+
+
+class SinglePassResource(Resource):
+    """ Factory's spec is the representation -> validation when creating. """
+
+    class PetSpec(Representation):
+        name = CountingCharField(max_length=5)
+        age = forms.IntegerField(required=False)
+
+    representation = PetSpec()
+    factory = Factory(klass=Person, spec=representation)
+
+    def put(self, pet, request):
+        self.put_data = pet
+
+
 class FactoryResource(Resource):
     representation = PersonSpec()
     factory = PersonFactory()
@@ -237,6 +355,27 @@ class FactoryResource(Resource):
         return person
 
 
+class BulkResource(Resource):
+    """ Create and list people one at a time. """
+
+    representation = PersonSpec()
+    factory = PersonFactory()
+    stream_response = True
+
+    def post(self, people, request):
+        self.created = []
+        for person in people:
+            self.created.append(person)
+
+    def put(self, people, request):
+        # the body must not have been read into memory as a whole
+        self.buffered = hasattr(request, '_body')
+        self.post(people, request)
+
+    def get(self, request):
+        return iter(self.created)
+
+
 class MyDefaultMapperResource_2(Resource):
     """ Define default mapper. """
     default_mapper = JsonMapper()
@@ -9,6 +9,7 @@
 import json
 import base64
 import logging
+import time
 from decimal import Decimal
 from django.http import HttpResponse
 from django.test import TestCase
@@ -102,6 +103,50 @@ class PermSyncDbTest(TestCase):
         for exp in expected:
             self.assertTrue(exp['codename'] in perms)
 
+    def test_sync_permissions(self):
+        import StringIO
+        from django.contrib.auth.models import Permission
+        from devil.perm.management import sync_permissions
+        Permission.objects.filter(
+            codename__in=('resource_my/perm/resource_put',
+                          'resource_my/perm/resource_delete')).delete()
+        expected = ['resource_my/perm/resource_put',
+                    'resource_my/perm/resource_delete']
+
+        # dry run only reports
+        out = StringIO.StringIO()
+        self.assertEquals(sync_permissions(dry_run=True, stdout=out), expected)
+        self.assertTrue("Would add permission 'resource_my/perm/resource_put'" in out.getvalue())
+        self.assertEquals(Permission.objects.filter(content_type__name='devil').count(), 2)
+
+        # content type lookup, existing permissions and the insert
+        with self.assertNumQueries(3):
+            self.assertEquals(sync_permissions(verbosity=0), expected)
+        self.assertEquals(Permission.objects.filter(content_type__name='devil').count(), 4)
+        self.assertEquals(sync_permissions(verbosity=0), [])
+        out = StringIO.StringIO()
+        self.assertEquals(sync_permissions(dry_run=True, verbosity=0, stdout=out), [])
+        self.assertEquals(out.getvalue(), 'No permissions to add\n')
+
+    def test_populate_conflict(self):
+        """ rows inserted meanwhile make bulk insert fall back to single rows """
+        from django.contrib.auth.models import Permission
+        from devil.perm import management
+        perm = Permission.objects.get(codename='resource_my/perm/resource_get')
+        content_type_id = perm.content_type_id
+        Permission.objects.filter(content_type_id=content_type_id).exclude(pk=perm.pk).delete()
+        missing = management._get_missing_permissions
+        management._get_missing_permissions = lambda resources, ct_id: [
+            'resource_my/perm/resource_put', 'resource_my/perm/resource_get']
+        try:
+            management._populate_permissions([], content_type_id)
+        finally:
+            management._get_missing_permissions = missing
+        self.assertEquals(
+            sorted(Permission.objects.filter(
+                content_type_id=content_type_id).values_list('codename', flat=True)),
+            ['resource_my/perm/resource_get', 'resource_my/perm/resource_put'])
+
 
 class PermTest(TestCase):
     """ Test permissions. """
@@ -160,6 +205,53 @@ class PermTest(TestCase):
                 test['status'],
                 '%d != %d: %s %s: %s' % (response.status_code, test['status'], test['user'], test['method'], response.content))
 
+    def test_cached_perm_names(self):
+        from django.contrib.auth.models import Permission, User
+        from devil.cache import LocalCache
+        from devil.perm.acl import PermissionController
+        controller = PermissionController(cache=LocalCache())
+        get_perm = 'resource_my/perm/resource_get'
+        put_perm = 'resource_my/perm/resource_put'
+
+        sith = User.objects.get(username='sith')
+        self.assertTrue(controller._has_perm(sith, get_perm))
+        self.assertFalse(controller._has_perm(sith, put_perm))
+        self.assertTrue(isinstance(controller._get_perm_names(sith), frozenset))
+        sith = User.objects.get(username='sith')
+        with self.assertNumQueries(0):
+            self.assertTrue(controller._has_perm(sith, get_perm))
+            self.assertFalse(controller._has_perm(sith, put_perm))
+
+        # granting a permission invalidates the cache
+        sith.user_permissions.add(Permission.objects.get(codename=put_perm))
+        sith = User.objects.get(username='sith')
+        self.assertTrue(controller._has_perm(sith, put_perm))
+
+    def test_precomputed_perm_names(self):
+        from devil.perm.acl import PermissionController
+        from deviltest.simple.resources import MyPermResource
+        controller = PermissionController()
+        resource = MyPermResource()
+
+        perm_names = controller._get_resource_perm_names(resource)
+        self.assertEquals(
+            sorted(perm_names.values()),
+            sorted(PermissionController.get_perm_names(resource)))
+        self.assertEquals(perm_names['put'], 'resource_my/perm/resource_put')
+        self.assertTrue(controller._get_resource_perm_names(resource) is perm_names)
+
+        # replacing the name() recomputes the names
+        resource.name = lambda: 'other'
+        self.assertEquals(
+            controller._get_resource_perm_names(resource)['get'],
+            'resource_other_get')
+
+        # resources are not kept alive
+        del resource
+        import gc
+        gc.collect()
+        self.assertEquals(len(controller._resource_perm_names), 0)
+
 
 class AuthTest(TestCase):
     """ Test authentication. """
@@ -198,6 +290,177 @@ class AuthTest(TestCase):
                 '%d != %d: %s/%s' % (response.status_code, result, username, password))
 
 
+class CachedAuthTest(TestCase):
+    """ Test caching of authentication results. """
+
+    fixtures = [
+        'auth_user.json',
+        ]
+
+    def setUp(self):
+        from devil import auth
+        self.calls = []
+        self._authenticate = auth.authenticate
+
+        def counting_authenticate(**credentials):
+            self.calls.append(credentials['username'])
+            return self._authenticate(**credentials)
+        auth.authenticate = counting_authenticate
+        testurls.cachedauthresource.authentication.cache.clear()
+
+    def tearDown(self):
+        from devil import auth
+        auth.authenticate = self._authenticate
+
+    def _get(self, username, password):
+        client = DevilClient(username=username, password=password)
+        return client.get('/simple/auth/cached').status_code
+
+    def test_cached(self):
+        self.assertEquals(self._get('jedi', 'jedi'), 200)
+        self.assertEquals(self._get('jedi', 'jedi'), 200)
+        self.assertEquals(self._get('jedi', 'sith'), 403)
+        self.assertEquals(self._get('jedi', 'sith'), 403)
+        self.assertEquals(self._get('sith', 'jedi'), 403)
+        self.assertEquals(self._get(None, None), 401)
+        self.assertEquals(self.calls, ['jedi', 'jedi', 'sith'])
+
+    def test_password_change(self):
+        from django.contrib.auth.models import User
+        self.assertEquals(self._get('jedi', 'jedi'), 200)
+        user = User.objects.get(username='jedi')
+        user.set_password('yoda')
+        user.save()
+        self.assertEquals(self._get('jedi', 'jedi'), 403)
+        self.assertEquals(self._get('jedi', 'yoda'), 200)
+        self.assertEquals(self._get('jedi', 'yoda'), 200)
+        user.is_active = False
+        user.save()
+        self.assertEquals(self._get('jedi', 'yoda'), 401)
+        self.assertEquals(self.calls, ['jedi', 'jedi', 'jedi', 'jedi'])
+
+    def test_failure_forgotten_on_save(self):
+        from django.contrib.auth.models import User
+        self.assertEquals(self._get('jedi', 'yoda'), 403)
+        self.assertEquals(self._get('jedi', 'yoda'), 403)
+        user = User.objects.get(username='jedi')
+        user.set_password('yoda')
+        user.save()
+        self.assertEquals(self._get('jedi', 'yoda'), 200)
+
+        # a new user is not rejected by a cached failure
+        self.assertEquals(self._get('luke', 'luke'), 403)
+        user = User(username='luke')
+        user.set_password('luke')
+        user.save()
+        self.assertEquals(self._get('luke', 'luke'), 200)
+        self.assertEquals(self.calls, ['jedi', 'jedi', 'luke', 'luke'])
+
+
+class HmacAuthTest(TestCase):
+    """ Test token and HMAC signature authentication. """
+
+    fixtures = [
+        'auth_user.json',
+        ]
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.auth = testurls.hmacauthresource.authentication
+        self.user = User.objects.get(username='jedi')
+
+    def _get(self, authorization, query=''):
+        client = Client()
+        return client.get('/simple/auth/hmac' + query, HTTP_AUTHORIZATION=authorization)
+
+    def test_token(self):
+        token = self.auth.make_token(self.user, 'k1')
+        # resource doesn't allow anonymous access, so the user is loaded
+        # to check that it's still active
+        with self.assertNumQueries(1):
+            response = self._get('Bearer ' + token)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.content, 'Hello, HMAC!')
+        response = self._get('Bearer ' + token, '?user&format=text')
+        self.assertEquals(response.content, 'jedi')
+
+    def test_invalid_token(self):
+        token = self.auth.make_token(self.user, 'k1')
+        key_id, user_id, expires, signature = token.split('.')
+        tests = (
+            ('k1.1.%s.%s' % (expires, signature), 403),
+            ('k2.2.%s.%s' % (expires, signature), 403),
+            ('k3.2.%s.%s' % (expires, signature), 403),
+            ('k1.2.%s.%s' % (int(expires) + 1, signature), 403),
+            ('k1.2.%s' % (expires,), 403),
+            (self.auth.make_token(self.user, 'k1', expires_in=-1), 403),
+            (self.auth.make_token(self.user, 'k2'), 200),
+            )
+        for token, result in tests:
+            self.assertEquals(self._get('Bearer ' + token).status_code, result, token)
+        self.assertEquals(self._get('').status_code, 401)
+        self.assertEquals(self._get('Token abc').status_code, 401)
+
+    def test_inactive_user(self):
+        token = self.auth.make_token(self.user, 'k1')
+        authorization = self.auth.sign('GET', '/simple/auth/hmac', '', self.user, 'k2')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEquals(self._get('Bearer ' + token).status_code, 403)
+        self.assertEquals(self._get(authorization).status_code, 403)
+        self.user.delete()
+        self.assertEquals(self._get('Bearer ' + token).status_code, 403)
+
+    def test_signature(self):
+        client = Client()
+        body = '{"a": 1}'
+        authorization = self.auth.sign('PUT', '/simple/auth/hmac?format=text', body, self.user, 'k2')
+        response = client.put('/simple/auth/hmac?format=text', body, 'application/json',
+                              HTTP_AUTHORIZATION=authorization)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.content, 'jedi')
+        self.assertEquals(testurls.hmacauthresource.put_data, {'a': 1})
+        # tampered body
+        response = client.put('/simple/auth/hmac?format=text', '{"a": 2}', 'application/json',
+                              HTTP_AUTHORIZATION=authorization)
+        self.assertEquals(response.status_code, 403)
+        # too old
+        authorization = self.auth.sign('GET', '/simple/auth/hmac', '', self.user, 'k2',
+                                       timestamp=time.time() - 600)
+        self.assertEquals(self._get(authorization).status_code, 403)
+        authorization = self.auth.sign('GET', '/simple/auth/hmac', '', self.user, 'k2')
+        self.assertEquals(self._get(authorization).status_code, 200)
+
+    def test_signature_body(self):
+        from django.test.client import RequestFactory
+        body = '{"a": "%s"}' % ('x' * 200000,)
+        authorization = self.auth.sign('POST', '/simple/auth/hmac', body, self.user, 'k1')
+        request = RequestFactory().post('/simple/auth/hmac', body, 'application/json',
+                                        HTTP_AUTHORIZATION=authorization)
+        request.user = None
+        self.auth.spool_size = 1024
+        try:
+            self.assertEquals(self.auth.authenticate(request).pk, self.user.pk)
+        finally:
+            del self.auth.spool_size
+        # the resource can still read the body
+        self.assertEquals(request.read(10), body[:10])
+        self.assertEquals(request.read(), body[10:])
+
+        # the body is not read for unknown keys
+        request = RequestFactory().post(
+            '/simple/auth/hmac', body, 'application/json',
+            HTTP_AUTHORIZATION='HMAC k3:1:%d:abc' % (time.time(),))
+        request.user = None
+        self.assertRaises(errors.Forbidden, self.auth.authenticate, request)
+        self.assertFalse(request._read_started)
+
+        # max_input_size is enforced before authentication
+        response = Client().put('/simple/auth/hmac', body, 'application/json',
+                                HTTP_AUTHORIZATION='HMAC k1:1:%d:abc' % (time.time(),))
+        self.assertEquals(response.status_code, 413)
+
+
 class HttpParseTest(TestCase):
     """ Test parsing using test client """
 
@@ -220,6 +483,20 @@ class HttpParseTest(TestCase):
             'application/json')
         self.assertEquals(response.status_code, 200)
 
+    def test_max_input_size(self):
+        client = Client()
+        response = client.put(
+            '/simple/mapper/limited',
+            '{"a": 1}',
+            'application/json')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(testurls.limitedechoresource.mydata, {'a': 1})
+        response = client.put(
+            '/simple/mapper/limited',
+            '{"a": 1, "b": 2, "c": 3}',
+            'application/json')
+        self.assertEquals(response.status_code, 413)
+
     def test_my_mapper(self):
         client = Client()
         response = client.put(
@@ -337,6 +614,235 @@ class JsonDecimalMapperTests(TestCase):
             })
 
 
+class JsonBackendTests(TestCase):
+    """ Test that all available JSON backends behave the same """
+
+    def _get_backends(self):
+        from devil.mappers import jsonmapper
+        return [b for b in jsonmapper.backends if b.available]
+
+    def test_default_backend(self):
+        from devil.mappers import jsonmapper
+        backend = jsonmapper.get_backend()
+        self.assertTrue(backend.available)
+        self.assertTrue(backend.auto_select)
+        self.assertRaises(ValueError, jsonmapper.get_backend, 'hiihoo')
+
+    def test_default_backend_exact_decimal(self):
+        from devil.mappers import jsonmapper
+        simplejson = jsonmapper.backends[0]
+        if not simplejson.available:
+            self.skipTest('simplejson is not installed')
+        accelerated = simplejson.accelerated
+        simplejson.accelerated = False
+        try:
+            self.assertTrue(jsonmapper.get_backend() is simplejson)
+            for m in (JsonMapper(pretty=False), JsonMapper(use_decimal=True, pretty=False)):
+                self.assertEquals(
+                    m._format_data({'price': Decimal('12345678901234567.10')}, 'utf-8'),
+                    '{"price":12345678901234567.10}')
+        finally:
+            simplejson.accelerated = accelerated
+
+    def test_format(self):
+        data = {'key': u'lähtö', 'list': [1, 2.5, Decimal('3.99')]}
+        for backend in self._get_backends():
+            m = JsonMapper(pretty=False, backend=backend.name)
+            self.assertEquals(json.loads(m.format(data).content), json.loads(
+                '{"key": "lähtö", "list": [1, 2.5, 3.99]}'))
+
+    def test_pretty_format(self):
+        for backend in self._get_backends():
+            if not backend.auto_select:
+                continue
+            m = JsonMapper(pretty=True, backend=backend)
+            self.assertEquals(m.format({'key': [1, 2]}).content,
+                              '{\n    "key": [\n        1,\n        2\n    ]\n}')
+
+    def test_parse(self):
+        for backend in self._get_backends():
+            m = JsonMapper(backend=backend)
+            self.assertEquals(m.parse('{"key": "lähtö", "n": 1.5}', 'utf-8'),
+                              {'key': u'lähtö', 'n': 1.5})
+            self.assertRaises(errors.BadRequest, m.parse, 'hiihoo')
+
+    def test_parse_decimal(self):
+        for backend in self._get_backends():
+            if not backend.supports_decimal:
+                self.assertRaises(ValueError, JsonMapper, use_decimal=True, backend=backend)
+                continue
+            m = JsonMapper(use_decimal=True, backend=backend)
+            result = m.parse('{"n": 3.99, "i": 1}')
+            self.assertEquals(result, {'n': Decimal('3.99'), 'i': 1})
+            self.assertTrue(isinstance(result['n'], Decimal))
+
+
+class MsgPackMapperTests(TestCase):
+    """ Test the MessagePack mapper (if msgpack is installed) """
+
+    def setUp(self):
+        from devil.mappers import MsgPackMapper
+        if not MsgPackMapper.available:
+            self.skipTest('msgpack is not installed')
+
+    def test_format_parse(self):
+        from devil.mappers import MsgPackMapper
+        m = MsgPackMapper()
+        data = {'key': u'l\xe4ht\xf6', 'list': [1, 2.5, Decimal('3.99'), None, True]}
+        response = m.format(data)
+        self.assertEquals(response['Content-Type'], 'application/x-msgpack')
+        self.assertEquals(m.parse(response.content), {
+            u'key': u'l\xe4ht\xf6', u'list': [1, 2.5, 3.99, None, True]})
+        self.assertEquals(m.format(None).content, '')
+        self.assertRaises(errors.BadRequest, m.parse, response.content[:-2])
+
+    def test_parse_decimal(self):
+        from devil.mappers import MsgPackMapper
+        m = MsgPackMapper(use_decimal=True)
+        data = m.format({'a': 2.99, 'b': [1, 3.5, {'c': 0.1}], 'd': 'x'}).content
+        parsed = m.parse(data)
+        self.assertEquals(parsed, {
+            'a': Decimal('2.99'), 'b': [1, Decimal('3.5'), {'c': Decimal('0.1')}], 'd': 'x'})
+        self.assertTrue(isinstance(parsed['b'][0], int))
+        self.assertEquals(m.parse(m.format(2.25).content), Decimal('2.25'))
+
+    def test_negotiation(self):
+        import msgpack
+        client = Client()
+        testurls.echoresource.mydata = {'a': [1, 2]}
+        response = client.get('/simple/mapper/echo?format=msgpack')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(msgpack.unpackb(response.content), {'a': [1, 2]})
+        response = client.get('/simple/mapper/echo', HTTP_ACCEPT='application/x-msgpack')
+        self.assertEquals(response['Content-Type'], 'application/x-msgpack')
+        response = client.put('/simple/mapper/echo', msgpack.packb({'b': u'x'}), 'application/x-msgpack')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(testurls.echoresource.mydata, {'b': u'x'})
+
+
+class NdjsonMapperTests(TestCase):
+
+    def test_format(self):
+        from devil.mappers import NdjsonMapper
+        m = NdjsonMapper()
+        self.assertEquals(m.format([{'a': 1}, {'b': [1, 2]}]).content, '{"a":1}\n{"b":[1,2]}\n')
+        self.assertEquals(m.format({'a': 1}).content, '{"a":1}\n')
+        self.assertEquals(''.join(m._format_data_stream(iter([{'a': 1}, 2]), 'utf-8')), '{"a":1}\n2\n')
+
+    def test_parse_stream(self):
+        from StringIO import StringIO
+        from devil.mappers import NdjsonMapper
+        m = NdjsonMapper(use_decimal=True)
+        m.chunk_size = 4
+        data = '{"a": 1.5}\n\n{"b": "l\xc3\xa4ht\xc3\xb6"}\n[1]'
+        expected = [{'a': Decimal('1.5')}, {'b': u'l\xe4ht\xf6'}, [1]]
+        self.assertEquals(list(m.parse(StringIO(data))), expected)
+        self.assertEquals(list(m.parse(data)), expected)
+        items = m.parse('{"a": 1}\n{"a": ')
+        self.assertEquals(items.next(), {'a': 1})
+        self.assertRaises(errors.BadRequest, items.next)
+
+    def test_bulk_post_get(self):
+        client = Client()
+        body = '{"name": "luke", "age": 19}\n{"name": "obi", "age": 65}\n'
+        response = client.post('/simple/bulk', body, 'application/x-ndjson')
+        self.assertEquals(response.status_code, 200)
+        created = testurls.bulkresource.created
+        self.assertEquals([(p.name, p.age) for p in created], [('luke', 19), ('obi', 65)])
+        response = client.get('/simple/bulk?format=ndjson')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEquals([json.loads(line) for line in ''.join(response).splitlines()], [
+            {'name': 'Luke', 'age': 19}, {'name': 'Obi', 'age': 65}])
+
+    def test_bulk_put_not_buffered(self):
+        client = Client()
+        body = '{"name": "luke", "age": 19}\n{"name": "obi", "age": 65}\n'
+        response = client.put('/simple/bulk', body, 'application/x-ndjson')
+        self.assertEquals(response.status_code, 200)
+        self.assertFalse(testurls.bulkresource.buffered)
+        self.assertEquals([p.name for p in testurls.bulkresource.created], ['luke', 'obi'])
+
+    def test_bulk_post_invalid(self):
+        client = Client()
+        body = '{"name": "luke", "age": 19}\n{"name": "obi", "age": "old"}\n'
+        response = client.post('/simple/bulk', body, 'application/x-ndjson')
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(len(testurls.bulkresource.created), 1)
+        response = client.post('/simple/bulk', '{"name": "luke", "age": 19}\n{', 'application/x-ndjson')
+        self.assertEquals(response.status_code, 400)
+
+
+class CsvMapperTests(TestCase):
+
+    def test_format(self):
+        from devil.mappers import CsvMapper
+        m = CsvMapper()
+        data = [{'b': u'l\xe4ht\xf6', 'a': 1}, {'a': None, 'b': 'x,"y"', 'c': 3}]
+        self.assertEquals(m.format(data).content, 'a,b\r\n1,l\xc3\xa4ht\xc3\xb6\r\n,"x,""y"""\r\n')
+        m = CsvMapper(columns=('b', 'c'))
+        self.assertEquals(m.format(data).content, 'b,c\r\nl\xc3\xa4ht\xc3\xb6,\r\n"x,""y""",3\r\n')
+        self.assertEquals(m.format({'c': 1}).content, 'b,c\r\n,1\r\n')
+
+    def test_parse(self):
+        from devil.mappers import CsvMapper
+        m = CsvMapper()
+        self.assertEquals(m.parse('a,b\r\n1,l\xc3\xa4ht\xc3\xb6\r\n\r\n,"x,""y"""\r\n'), [
+            {'a': '1', 'b': u'l\xe4ht\xf6'}, {'a': '', 'b': 'x,"y"'}])
+        self.assertRaises(errors.BadRequest, m.parse, 'a,b\r\n1,2,3\r\n')
+
+    def test_format_not_tabular(self):
+        from devil.mappers import CsvMapper
+        m = CsvMapper()
+        for data in ('hiihoo', [1, 2], [{'a': 1}, 'b'], 5):
+            self.assertRaises(errors.NotAcceptable, m.format, data)
+        m = CsvMapper(columns=('a',))
+        self.assertRaises(errors.NotAcceptable, m.format, ['a'])
+        response = Client().get('/simple/mapper/text?format=csv')
+        self.assertEquals(response.status_code, 406)
+
+    def test_representation_columns(self):
+        client = Client()
+        response = client.post('/simple/bulk', 'name,age\r\nluke,19\r\nobi,65\r\n', 'text/csv')
+        self.assertEquals(response.status_code, 200)
+        response = client.get('/simple/bulk?format=csv')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEquals(''.join(response), 'age,name\r\n19,Luke\r\n65,Obi\r\n')
+        response = client.post('/simple/bulk', 'name,age\r\nluke,young\r\n', 'text/csv')
+        self.assertEquals(response.status_code, 400)
+
+
+class JsonPrettyTests(TestCase):
+    """ Test compact and pretty JSON output """
+
+    def test_compact_mapper(self):
+        m = JsonMapper(pretty=False)
+        resp = m.format({'key': [1, 2]})
+        self.assertEquals(resp.content, '{"key":[1,2]}')
+
+    def test_pretty_query_param(self):
+        client = Client()
+        resp = client.get('/simple/mapper/decimal?format=json&pretty=0')
+        self.assertEquals(resp.content, '{"a":5.02,"b":3.99}')
+        resp = client.get('/simple/mapper/decimal?format=json&pretty=1')
+        self.assertEquals(resp.content, '{\n    "a": 5.02,\n    "b": 3.99\n}')
+
+    def test_settings(self):
+        from django.test.utils import override_settings
+        client = Client()
+        with override_settings(DEVIL_JSON_PRETTY=False):
+            resp = client.get('/simple/mapper/decimal?format=json')
+            self.assertEquals(resp.content, '{"a":5.02,"b":3.99}')
+            resp = client.get('/simple/mapper/decimal?format=json&pretty=true')
+            self.assertEquals(resp.content, '{\n    "a": 5.02,\n    "b": 3.99\n}')
+
+    def test_compact_stream(self):
+        client = Client()
+        response = client.get('/simple/stream?format=json&pretty=0')
+        self.assertEquals(''.join(response), '[{"name":"Luke"},{"name":"Shmi"}]')
+
+
 class MapperFormatTest(TestCase):
     """ Test formatting directly (bypassing http)
 
@@ -614,6 +1120,80 @@ class DataMapperManagerTests(TestCase):
         self.assertEquals(6, len(self.manager._datamappers.items()))
         self.assertEquals(self.manager._datamappers['*/*'].content_type, 'text/xml')
 
+    def test_format_from_path(self):
+        tests = (
+            ('/user.json', 'json'),
+            ('/user.1.xml', 'xml'),
+            ('.json', 'json'),
+            ('/user', None),
+            ('/user.', None),
+            ('/user.toolongext', None),
+            ('/v1.2/user', None),
+            )
+        for path, expected in tests:
+            self.assertEquals(expected, self.manager._get_format_from_path(path))
+
+    def test_accept_cache(self):
+        class FooResource(Resource): pass
+        foores = FooResource()
+        request = FakeRequest('/hiihoo')
+        request.META['HTTP_ACCEPT'] = 'text/yaml,application/*;q=0.8'
+        self.manager.register_mapper(JsonMapper(), 'application/json', 'json')
+        self.assertEquals('application/json',
+                          self.manager.select_formatter(request, foores).content_type)
+        self.assertEquals('application/json',
+                          self.manager.select_formatter(request, foores).content_type)
+        self.assertEquals(1, self.manager.accept_cache_misses)
+        self.assertEquals(1, self.manager.accept_cache_hits)
+
+        # registering a mapper invalidates the cache
+        self.manager.register_mapper(XmlMapper(), 'application/xml', 'xml')
+        self.assertEquals('text/xml',
+                          self.manager.select_formatter(request, foores).content_type)
+        self.assertEquals(2, self.manager.accept_cache_misses)
+
+        # unsupported types are remembered too
+        request.META['HTTP_ACCEPT'] = 'text/yaml'
+        for i in range(2):
+            self.assertRaises(errors.NotAcceptable,
+                              self.manager.select_formatter, request, foores)
+        self.assertEquals(3, self.manager.accept_cache_misses)
+        self.assertEquals(2, self.manager.accept_cache_hits)
+
+    def test_accept_cache_size(self):
+        class FooResource(Resource): pass
+        foores = FooResource()
+        self.manager.accept_cache_size = 2
+        self.manager.register_mapper(JsonMapper(), 'application/json', 'json')
+        for accept in ('application/json', 'application/*', '*/*', 'application/json'):
+            request = FakeRequest('/hiihoo')
+            request.META['HTTP_ACCEPT'] = accept
+            self.manager.select_formatter(request, foores)
+        self.assertEquals(['*/*', 'application/json'], self.manager._accept_cache.keys())
+        self.assertEquals(4, self.manager.accept_cache_misses)
+
+    def test_accept_cache_threads(self):
+        import threading
+        class FooResource(Resource): pass
+        foores = FooResource()
+        self.manager.accept_cache_size = 8
+        self.manager.register_mapper(JsonMapper(), 'application/json', 'json')
+
+        def select(num):
+            for i in range(200):
+                request = FakeRequest('/hiihoo')
+                request.META['HTTP_ACCEPT'] = 'application/json;q=0.%d' % ((num + i) % 20,)
+                self.manager.select_formatter(request, foores)
+
+        threads = [threading.Thread(target=select, args=(num,)) for num in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(8, len(self.manager._accept_cache))
+        self.assertEquals(8, len(self.manager._accept_cache.keys()))
+        self.assertEquals(1600, self.manager.accept_cache_hits + self.manager.accept_cache_misses)
+
     def test_priorities_in_accept_header_1(self):
         client = Client()
         response = client.get(
@@ -722,6 +1302,340 @@ class ValidationTest(TestCase):
         self.assertEquals(response.status_code, 200)
 
 
+class OutputValidationPolicyTest(TestCase):
+
+    def tearDown(self):
+        del testurls.validationresource.output_validation
+
+    def _get_status(self, policy):
+        testurls.validationresource.output_validation = policy
+        client = Client()
+        return client.get('/simple/valid?format=json&status=badlist').status_code
+
+    def test_debug(self):
+        # test runner turns DEBUG off
+        self.assertEquals(self._get_status('debug'), 200)
+
+    def test_factory(self):
+        # there's no factory, data must be validated
+        self.assertEquals(self._get_status('factory'), 500)
+
+    def test_sampled(self):
+        self.assertEquals(self._get_status(1), 500)
+
+    def test_forced(self):
+        from django.test.utils import override_settings
+        with override_settings(DEVIL_FORCE_OUTPUT_VALIDATION=True):
+            self.assertEquals(self._get_status('debug'), 500)
+
+    def test_invalid_policy(self):
+        # invalid values are rejected when the resource is created
+        for policy in (0, False, True, -1, 'never', None):
+            resource_class = type('InvalidResource', (Resource,), {'output_validation': policy})
+            self.assertRaises(ValueError, resource_class)
+        resource_class = type('SampledResource', (Resource,), {'output_validation': 10})
+        self.assertTrue(resource_class()._should_validate_output(None) in (True, False))
+        self.assertEquals(self._get_status(1), 500)
+
+
+class StreamTest(TestCase):
+
+    def test_stream_json(self):
+        client = Client()
+        response = client.get('/simple/stream?format=json')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'application/json; charset=utf-8')
+        self.assertEquals(json.loads(''.join(response)),
+                          [{'name': 'Luke'}, {'name': 'Shmi'}])
+
+    def test_stream_empty(self):
+        client = Client()
+        response = client.get('/simple/stream?format=json&names=')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(''.join(response), '[]')
+
+    def test_stream_xml(self):
+        """ mappers that can't stream format the whole list at once """
+        client = Client()
+        response = client.get('/simple/stream?format=xml')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(''.join(response), '<?xml version="1.0" encoding="utf-8"?>\n<root><_item><name>Luke</name></_item><_item><name>Shmi</name></_item></root>')
+
+    def test_stream_validation_fail(self):
+        client = Client()
+        response = client.get('/simple/stream?format=json&names=Luke,Skywalker')
+        self.assertEquals(response.status_code, 200)
+        self.assertRaises(errors.InternalServerError, ''.join, response)
+
+    def test_stream_queryset(self):
+        """ querysets are iterated without filling their result cache """
+        from django.contrib.auth.models import Permission
+        from deviltest.simple.resources import MyStreamResource
+        resource = MyStreamResource()
+        resource.representation = None
+        items = Permission.objects.values('codename')
+        request = FakeRequest('/simple/stream')
+        request.method = 'GET'
+        streamed = list(resource._iter_output_data(items, request))
+        self.assertEquals(len(streamed), Permission.objects.count())
+        self.assertEquals(items._result_cache, None)
+
+
+class CompressionTest(TestCase):
+
+    def test_select_encoding(self):
+        from devil.compression import select_encoding
+        self.assertEquals(select_encoding(''), None)
+        self.assertEquals(select_encoding('gzip, deflate'), 'gzip')
+        self.assertEquals(select_encoding('deflate, gzip;q=0.5'), 'deflate')
+        self.assertEquals(select_encoding('x-gzip'), 'gzip')
+        self.assertEquals(select_encoding('*;q=0.1, gzip;q=0'), 'deflate')
+        self.assertEquals(select_encoding('identity, br'), None)
+
+    def test_gzip(self):
+        import gzip
+        from StringIO import StringIO
+        client = Client()
+        response = client.get('/simple/compressed?format=json', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Encoding'], 'gzip')
+        self.assertEquals(response['Vary'], 'Accept-Encoding')
+        content = gzip.GzipFile(fileobj=StringIO(response.content)).read()
+        self.assertEquals(json.loads(content), {'name': 'x' * 200})
+
+    def test_deflate(self):
+        import zlib
+        client = Client()
+        response = client.get('/simple/compressed?format=json', HTTP_ACCEPT_ENCODING='deflate')
+        self.assertEquals(response['Content-Encoding'], 'deflate')
+        self.assertEquals(json.loads(zlib.decompress(response.content)), {'name': 'x' * 200})
+
+    def test_not_compressed(self):
+        client = Client()
+        response = client.get('/simple/compressed?format=json')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEquals(response['Vary'], 'Accept-Encoding')
+        self.assertEquals(json.loads(response.content), {'name': 'x' * 200})
+        # too small
+        response = client.get('/simple/compressed?format=json&size=5', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+        self.assertEquals(json.loads(response.content), {'name': 'x' * 5})
+
+    def test_compressed_input(self):
+        import zlib
+        from devil.compression import compress
+        client = Client()
+        data = {'a': 'x' * 1000, 'b': range(100)}
+        response = client.put('/simple/mapper/echo', compress(json.dumps(data), 'gzip'),
+                              'application/json', HTTP_CONTENT_ENCODING='gzip')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(testurls.echoresource.mydata, data)
+        testurls.echoresource.input_chunk_size = 16
+        try:
+            response = client.put('/simple/mapper/echo', zlib.compress('<root><a>1</a><b>text</b></root>'),
+                                  'text/xml', HTTP_CONTENT_ENCODING='deflate')
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(testurls.echoresource.mydata, {'a': 1, 'b': 'text'})
+        finally:
+            del testurls.echoresource.input_chunk_size
+
+    def test_short_reads(self):
+        """ the body is read until Content-Length even if reads return less """
+        from django.test.client import RequestFactory
+        data = {'a': 'x' * 100}
+
+        class ShortReads(object):
+            def __init__(self, stream):
+                self.stream = stream
+
+            def read(self, size=-1):
+                return self.stream.read(3 if size < 0 else min(size, 3))
+
+        request = RequestFactory().put('/simple/mapper/echo', json.dumps(data), 'application/json')
+        request._stream = ShortReads(request._stream)
+        response = testurls.echoresource(request)
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(testurls.echoresource.mydata, data)
+
+    def test_form_put(self):
+        """ django parses form encoded PUTs, other bodies are left unread """
+        from django.test.client import RequestFactory
+        from devil.resource import coerce_put_post
+        request = RequestFactory().put('/simple/mapper/echo', 'a=1&b=2',
+                                       'application/x-www-form-urlencoded')
+        coerce_put_post(request)
+        self.assertEquals(request.PUT['a'], '1')
+        request = RequestFactory().put('/simple/mapper/echo', 'a=1', 'application/json')
+        coerce_put_post(request)
+        self.assertEquals(len(request.PUT), 0)
+        self.assertFalse(request._read_started)
+
+    def test_compressed_input_errors(self):
+        from devil.compression import compress
+        client = Client()
+        body = compress(json.dumps({'a': ' ' * 10000}), 'gzip')
+        testurls.echoresource.max_decompressed_input_size = 5000
+        try:
+            response = client.put('/simple/mapper/echo', body, 'application/json',
+                                  HTTP_CONTENT_ENCODING='gzip')
+            self.assertEquals(response.status_code, 413)
+        finally:
+            del testurls.echoresource.max_decompressed_input_size
+        response = client.put('/simple/mapper/echo', body[:-20] + 'x' * 20, 'application/json',
+                              HTTP_CONTENT_ENCODING='gzip')
+        self.assertEquals(response.status_code, 400)
+        response = client.put('/simple/mapper/echo', body, 'application/json',
+                              HTTP_CONTENT_ENCODING='br')
+        self.assertEquals(response.status_code, 415)
+
+    def test_stream(self):
+        import zlib
+        client = Client()
+        response = client.get('/simple/compressed?format=json&stream=1&size=5', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEquals(response['Content-Encoding'], 'gzip')
+        content = zlib.decompress(''.join(response), 16 + zlib.MAX_WBITS)
+        self.assertEquals(json.loads(content), [{'name': 'xxxxx'}] * 3)
+
+
+class ETagTest(TestCase):
+
+    def setUp(self):
+        testurls.versionedresource.version = 1
+        testurls.versionedresource.calls = 0
+
+    def test_version_etag(self):
+        client = Client()
+        response = client.get('/simple/versioned?format=json')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['ETag'], 'W/"1"')
+        self.assertEquals(testurls.versionedresource.calls, 1)
+        response = client.get('/simple/versioned?format=json', HTTP_IF_NONE_MATCH='"0", W/"1"')
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response.content, '')
+        self.assertEquals(response['ETag'], 'W/"1"')
+        self.assertEquals(testurls.versionedresource.calls, 1)
+        # version changes
+        response = client.put('/simple/versioned', '{}', 'application/json')
+        self.assertFalse(response.has_header('ETag'))
+        response = client.get('/simple/versioned?format=json', HTTP_IF_NONE_MATCH='W/"1"')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['ETag'], 'W/"2"')
+        self.assertEquals(testurls.versionedresource.calls, 2)
+
+    def test_strong_etag(self):
+        client = Client()
+        response = client.get('/simple/versioned?format=json&noversion')
+        self.assertEquals(response.status_code, 200)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        response = client.get('/simple/versioned?format=json&noversion', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response.content, '')
+        response = client.get('/simple/versioned?format=xml&noversion', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response['ETag'], etag)
+        self.assertEquals(testurls.versionedresource.calls, 3)
+
+    def test_no_etag(self):
+        client = Client()
+        response = client.get('/simple/mapper/dict?format=json')
+        self.assertFalse(response.has_header('ETag'))
+
+
+class ResponseCacheTest(TestCase):
+
+    fixtures = [
+        'auth_user.json',
+        ]
+
+    def setUp(self):
+        testurls.cachedresource.response_cache.clear()
+        testurls.cachedresource.calls = 0
+
+    def test_local_cache(self):
+        from devil.cache import LocalCache
+        cache = LocalCache(max_size=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEquals(cache.get('a'), 1)
+        cache.set('c', 3)
+        # b was least recently used
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(cache.get('a'), 1)
+        self.assertEquals(cache.get('c'), 3)
+        cache.set('d', 4, timeout=0)
+        self.assertEquals(cache.get('d', 'expired'), 'expired')
+        cache.delete('a')
+        self.assertEquals(len(cache), 1)
+
+    def test_django_cache(self):
+        from devil.cache import DjangoCache
+        cache = DjangoCache(timeout=60)
+        cache.set(('a', 1), {'b': 2})
+        self.assertEquals(cache.get(('a', 1)), {'b': 2})
+        self.assertEquals(cache.get(('a', 2)), None)
+        cache.delete(('a', 1))
+        self.assertEquals(cache.get(('a', 1)), None)
+
+    def test_cached_get(self):
+        client = Client()
+        response = client.get('/simple/cached/a?format=json')
+        self.assertEquals(json.loads(response.content), {'calls': 1, 'page': None})
+        response = client.get('/simple/cached/a?format=json&other=1')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'application/json; charset=utf-8')
+        self.assertEquals(json.loads(response.content), {'calls': 1, 'page': None})
+        # different url argument, query parameter and mapper
+        response = client.get('/simple/cached/b?format=json')
+        self.assertEquals(json.loads(response.content), {'calls': 2, 'page': None})
+        response = client.get('/simple/cached/a?format=json&page=2')
+        self.assertEquals(json.loads(response.content), {'calls': 3, 'page': '2'})
+        response = client.get('/simple/cached/a?format=xml')
+        self.assertEquals(response['Content-Type'], 'text/xml; charset=utf-8')
+        self.assertEquals(testurls.cachedresource.calls, 4)
+
+    def test_cached_pretty(self):
+        """ the mapper's own query parameters are part of the key """
+        client = Client()
+        compact = client.get('/simple/cached/a?format=json&pretty=0').content
+        self.assertFalse('\n' in compact)
+        pretty = client.get('/simple/cached/a?format=json&pretty=1').content
+        self.assertTrue('\n' in pretty)
+        self.assertEquals(json.loads(pretty), {'calls': 2, 'page': None})
+        self.assertEquals(client.get('/simple/cached/a?format=json&pretty=0').content, compact)
+        self.assertEquals(testurls.cachedresource.calls, 2)
+
+    def test_lazy_user(self):
+        """ lazily loaded users are loaded only for per user caching """
+        from django.contrib.auth.models import User
+        from devil.auth import HttpHmac
+        resource = testurls.cachedresource
+        resource.authentication = HttpHmac(keys={'k1': 'secret'})
+        token = resource.authentication.make_token(User.objects.get(username='jedi'), 'k1')
+        client = Client()
+        try:
+            with self.assertNumQueries(1):
+                client.get('/simple/cached/a?format=json', HTTP_AUTHORIZATION='Bearer ' + token)
+            resource.response_cache_per_user = False
+            with self.assertNumQueries(0):
+                client.get('/simple/cached/a?format=json', HTTP_AUTHORIZATION='Bearer ' + token)
+                response = client.get('/simple/cached/a?format=json')
+            self.assertEquals(json.loads(response.content), {'calls': 2, 'page': None})
+        finally:
+            del resource.authentication
+            del resource.response_cache_per_user
+
+    def test_invalidation(self):
+        client = Client()
+        client.get('/simple/cached/a?format=json')
+        client.get('/simple/cached/a?format=json')
+        self.assertEquals(testurls.cachedresource.calls, 1)
+        client.put('/simple/cached/b', '{}', 'application/json')
+        response = client.get('/simple/cached/a?format=json')
+        self.assertEquals(json.loads(response.content), {'calls': 2, 'page': None})
+
+
 class DefaultMapperTest(TestCase):
 
     def test_default_txt(self):
@@ -749,6 +1663,46 @@ class XmlMapperTest(TestCase):
         response = client.put('/simple/mapper/echo', response.content, 'text/xml')
         self.assertEquals(originaldata, testurls.echoresource.mydata)
 
+    def test_streamed_input(self):
+        """ body larger than the first chunk is read from the stream """
+
+        client = Client()
+        testurls.echoresource.input_chunk_size = 8
+        try:
+            response = client.put(
+                '/simple/mapper/echo', '<root><a>1</a><b>text</b></root>', 'text/xml')
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(testurls.echoresource.mydata, {'a': 1, 'b': 'text'})
+            response = client.put(
+                '/simple/mapper/echo', '{"a": 1, "b": "text"}', 'application/json')
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(testurls.echoresource.mydata, {'a': 1, 'b': 'text'})
+        finally:
+            del testurls.echoresource.input_chunk_size
+
+    def test_format_escaping(self):
+        """ text is escaped and encoded using the given charset """
+
+        mapper = XmlMapper()
+        data = {'a': [u'<b>&', u'\xe4\u20ac']}
+        self.assertEquals(
+            mapper._format_data(data, 'utf-8'),
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<root><a><a_item>&lt;b&gt;&amp;</a_item><a_item>\xc3\xa4\xe2\x82\xac</a_item></a></root>')
+        self.assertEquals(
+            mapper._format_data(data, 'iso-8859-1'),
+            '<?xml version="1.0" encoding="iso-8859-1"?>\n'
+            '<root><a><a_item>&lt;b&gt;&amp;</a_item><a_item>\xe4&#8364;</a_item></a></root>')
+
+    def test_format_stream(self):
+        """ streamed document equals the one formatted at once """
+
+        mapper = XmlMapper()
+        items = [{'a': 1}, {'a': [1, u'<']}, 'x']
+        self.assertEquals(
+            ''.join(mapper._format_data_stream(iter(items), 'utf-8')),
+            mapper._format_data(items, 'utf-8'))
+
     def test_xml_decimal(self):
         """ test that numbers are converted to `Decimals` """
 
@@ -908,6 +1862,31 @@ class XmlMapperTest(TestCase):
         self.assertEquals(response.status_code, 200)
         self.assertEquals(response.content, '<?xml version="1.0" encoding="utf-8"?>\n<root><a>3.99</a><c><c_item>1</c_item><c_item>2</c_item><c_item>3.99</c_item></c><b>text</b><d><d_item><age>23</age><name>luke</name></d_item><d_item><age>65</age><name>obi</name></d_item></d></root>')
 
+    def test_expat_parser(self):
+        """ expat backend produces the same data as the sax backend """
+
+        from StringIO import StringIO
+        xml = """<?xml version="1.0" encoding="utf-8"?>
+        <root>
+          <a>3.99</a>
+          <b>text &amp; \xc3\xa4</b>
+          <e></e>
+          <c><x>1</x><x>2</x><y>3.99</y></c>
+          <d>
+            <d_item><age>23</age><name>luke</name></d_item>
+            <d_item><age>65</age><name>obi</name></d_item>
+          </d>
+        </root>
+        """
+        for numbermode in (None, 'basic', 'decimal'):
+            expected = XmlMapper(numbermode=numbermode).parse(xml)
+            mapper = XmlMapper(numbermode=numbermode, parser='expat')
+            self.assertEquals(mapper.parse(xml), expected)
+            self.assertEquals(mapper.parse(StringIO(xml)), expected)
+        self.assertEquals(expected['b'], u'text & \xe4')
+        self.assertEquals(expected['c'], [Decimal(1), Decimal(2), Decimal('3.99')])
+        self.assertRaises(ValueError, XmlMapper, parser='lxml')
+
 
 class RepresentationToModelTests(TestCase):
 
@@ -969,6 +1948,39 @@ class FactoryTests(TestCase):
         self.assertEquals(35, person.age)
         self.assertEquals('Jedi', person.name)
 
+    def test_single_pass(self):
+        """ fields are cleaned only once when factory validates """
+        from resources import CountingCharField, Person
+
+        client = Client()
+        CountingCharField.cleaned = 0
+        response = client.put(
+            '/simple/singlepass',
+            json.dumps([{'name': 'jedi', 'age': 35}, {'name': 'sith'}]),
+            'application/json')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(CountingCharField.cleaned, 2)
+        people = testurls.singlepassresource.put_data
+        self.assertTrue(isinstance(people[0], Person))
+        self.assertEquals(['jedi', 'sith'], [p.name for p in people])
+        self.assertEquals([35, None], [p.age for p in people])
+
+    def test_single_pass_errors(self):
+        """ errors are the same as with separate validation """
+        from django.core.exceptions import ValidationError
+        from resources import SinglePassResource
+
+        client = Client()
+        for data in ({'name': 'skywalker', 'jedi': True}, {'age': 'old'}, 'luke'):
+            try:
+                SinglePassResource.representation.validate(data)
+            except ValidationError, exc:
+                expected = str(exc)
+            response = client.put(
+                '/simple/singlepass', json.dumps(data), 'application/json')
+            self.assertEquals(response.status_code, 400)
+            self.assertEquals(response.content, expected)
+
 
 #
 # tests.py ends here
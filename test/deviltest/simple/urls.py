@@ -18,6 +18,7 @@ anonresource = resources.MyAnonResource()
 permresource = resources.MyPermResource()
 noneresource = resources.MyNoneResource()
 echoresource = resources.MyEchoResource()
+limitedechoresource = resources.MyLimitedEchoResource()
 personresource = resources.PersonResource()
 mapperresource = resources.MyMapperResource()
 decimalresource = resources.MyDecimalResource()
@@ -27,6 +28,14 @@ scandicjsonresource = resources.MyScandicJsonResource()
 defaulttxtmapperresource = resources.MyDefaultMapperResource_1()
 defaultobjmapperresource = resources.MyDefaultMapperResource_2()
 factoryresource = resources.FactoryResource()
+singlepassresource = resources.SinglePassResource()
+streamresource = resources.MyStreamResource()
+bulkresource = resources.BulkResource()
+compressedresource = resources.MyCompressedResource()
+versionedresource = resources.MyVersionedResource()
+cachedresource = resources.MyCachedResource()
+cachedauthresource = resources.MyCachedAuthResource()
+hmacauthresource = resources.MyHmacAuthResource()
 
 
 acl_resources = (
@@ -42,15 +51,24 @@ acl_resources = (
 urlpatterns = patterns('',
     url(r'^perm', permresource),
     url(r'^auth$', authresource),
+    url(r'^auth/cached$', cachedauthresource),
+    url(r'^auth/hmac$', hmacauthresource),
     url(r'^person', personresource),
     url(r'^auth/anon', anonresource),
     url(r'^valid', validationresource, name='validation'),
     url(r'^factory', factoryresource),
+    url(r'^singlepass', singlepassresource),
+    url(r'^stream', streamresource),
+    url(r'^bulk', bulkresource),
+    url(r'^compressed', compressedresource),
+    url(r'^versioned', versionedresource),
+    url(r'^cached/(?P<key>\w+)', cachedresource),
     url(r'^mapper/dict', dictresource),
     url(r'^mapper/text', textresource),
     url(r'^mapper/resp', respresource),
     url(r'^mapper/none', noneresource),
     url(r'^mapper/echo', echoresource),
+    url(r'^mapper/limited', limitedechoresource),
     url(r'^mapper/reverse', mapperresource),
     url(r'^mapper/decimal', decimalresource),
     url(r'^mapper/scandic$', scandicresource),